@@ -0,0 +1,289 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from copy import deepcopy
+from typing import Callable, Dict, List, Optional, Set
+
+import build
+import run
+import serialization
+from automaton import NFA, EPSILON, ThompsonBuilder
+from dfa import LazyDFA
+
+BENCHMARK_FORMAT_VERSION = 1  # must be increased whenever the JSON output changes incompatibly
+DEFAULT_REPEAT = 3  # every phase is run this many times and the fastest run is reported
+DEFAULT_THRESHOLD = 1.25  # a phase is a regression if it is this many times slower than the baseline
+MIN_COMPARED_TIME = 0.005  # phases faster than this many seconds are too noisy to compare
+
+PHASES = ('parse', 'thompson', 'remove_epsilon', 'reduce', 'serialize', 'simulate', 'simulate_lazy')
+
+
+def legacy_remove_epsilon(nfa: NFA) -> None:
+    """
+    Previous implementation of NFA.remove_epsilon, kept as a reference for benchmarks.
+    Copies the whole transition table on every pass while there are epsilon transitions left.
+    """
+    # first, all states that transition into accept state with epsilon, become accepting themselves
+    while True:
+        accept_count = len(nfa.accept_states)
+        for state in nfa.transitions:
+            if EPSILON not in nfa.transitions[state]:
+                continue
+            if nfa.transitions[state][EPSILON].intersection(nfa.accept_states):
+                nfa.accept_states.add(state)
+        if len(nfa.accept_states) == accept_count:
+            break
+
+    while any(EPSILON in nfa.transitions[state] for state in nfa.transitions):
+        temp: Dict[int, Dict[str, Set[int]]] = deepcopy(nfa.transitions)
+        for state in nfa.transitions:
+            if EPSILON not in nfa.transitions[state]:
+                continue
+
+            visited = set()
+            stack = [state]
+            while stack:
+                curr_state = stack.pop()
+                if curr_state in visited:
+                    continue
+                visited.add(curr_state)
+                if curr_state not in nfa.transitions:
+                    continue
+
+                for symbol in nfa.transitions[curr_state]:
+                    if symbol == EPSILON:
+                        for transition_state in nfa.transitions[curr_state][EPSILON]:
+                            stack.append(transition_state)
+                            if curr_state in temp and EPSILON in temp[curr_state]:
+                                temp[curr_state][EPSILON].remove(transition_state)
+                        if curr_state in temp and EPSILON in temp[curr_state]:
+                            del temp[curr_state][EPSILON]
+                        if curr_state in temp and not temp[curr_state]:
+                            del temp[curr_state]
+                    else:
+                        if state not in temp:
+                            temp[state] = dict()
+                        if symbol not in temp[state]:
+                            temp[state][symbol] = set()
+                        for transition_state in nfa.transitions[curr_state][symbol]:
+                            temp[state][symbol].add(transition_state)
+
+        nfa.transitions = temp
+
+
+def starred_groups_regex(size: int) -> str:
+    """
+    Generates a regex with roughly `size` symbols made of concatenated groups with starred alternations.
+    Every group starts and ends with a symbol, so epsilon closures stay small and the epsilon-free NFA
+    has linear size.
+    """
+    return ''.join('(a(bc|d)*e)' for _ in range(max(1, size // 5)))
+
+
+def concatenation_regex(size: int) -> str:
+    return ''.join('abcd'[i % 4] for i in range(size))
+
+
+def nested_regex(depth: int) -> str:
+    return '(' * depth + 'a' + ')' * depth + '*'
+
+
+def alternation_regex(width: int) -> str:
+    """
+    Generates an alternation of `width` different words over 'abcd', the words have a common prefix
+    with many others, like keywords in a lexer.
+    """
+    words = []
+    for i in range(width):
+        word = ['a']
+        while i:
+            word.append('abcd'[i % 4])
+            i //= 4
+        words.append(''.join(word))
+    return '(' + '|'.join(words) + ')*'
+
+
+def nested_stars_regex(depth: int) -> str:
+    regex = 'a'
+    for i in range(depth):
+        regex = f"({regex}*{'bcd'[i % 3]})"
+    return regex + '*'
+
+
+def starred_parentheses_regex(depth: int) -> str:
+    """
+    Generates ((...(a)*...)*)* with `depth` stars. Every star adds an epsilon loop around the previous ones,
+    so the epsilon closures of all states overlap, while the epsilon-free NFA stays linear.
+    """
+    return '(' * depth + 'a' + ')*' * depth
+
+
+def random_input(length: int, alphabet: str = 'abcde', seed: int = 0) -> str:
+    generator = random.Random(seed)
+    return ''.join(generator.choice(alphabet) for _ in range(length))
+
+
+def starred_groups_input(length: int, seed: int = 0) -> str:
+    # words of the language of starred_groups_regex, so the simulation does not die after a few characters
+    generator = random.Random(seed)
+    parts = []
+    while sum(map(len, parts)) < length:
+        parts.append('a' + ''.join(generator.choice(['bc', 'd']) for _ in range(generator.randint(0, 3))) + 'e')
+    return ''.join(parts)[:length]
+
+
+# workload name -> (regex generator, size at scale 1, input generator)
+WORKLOADS: Dict[str, tuple] = {
+    'concatenation': (concatenation_regex, 5000, concatenation_regex),
+    'nesting': (nested_regex, 5000, lambda length: 'a' * length),
+    'alternation': (alternation_regex, 500, lambda length: random_input(length, 'abcd')),
+    'nested_stars': (nested_stars_regex, 100, lambda length: random_input(length, 'abcd')),
+    'starred_groups': (starred_groups_regex, 2000, starred_groups_input),
+}
+INPUT_LENGTH = 20000  # length of the simulated input strings at scale 1
+
+
+def time_call(function: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def benchmark_remove_epsilon() -> None:
+    # starred groups have small separate closures, where both versions are linear. nested stars have
+    # overlapping closures, which the previous version searches again from every state
+    for name, generator, sizes in [('starred_groups', starred_groups_regex, (250, 500, 1000, 2000)),
+                                   ('starred_parentheses', starred_parentheses_regex, (100, 200, 400, 800))]:
+        print(name)
+        print("   size  states  legacy (s)  closure (s)")
+        for size in sizes:
+            nfa = build.regex_to_nfa(generator(size))
+            legacy_nfa = deepcopy(nfa)
+
+            legacy_time = time_call(lambda: legacy_remove_epsilon(legacy_nfa))
+            closure_time = time_call(nfa.remove_epsilon)
+
+            # both versions must accept the same language, which here means exactly the same result
+            assert nfa.transitions == legacy_nfa.transitions
+            assert nfa.accept_states == legacy_nfa.accept_states
+
+            print(f"{size:7}  {len(nfa.states):6}  {legacy_time:10.4f}  {closure_time:11.4f}")
+
+
+def benchmark_workload(regex: str, input_string: str, repeat: int = DEFAULT_REPEAT) -> dict:
+    """
+    Times every phase of compiling the regex and simulating the input on the result.
+    :return: automaton sizes and {phase: fastest time in seconds}
+    """
+    timings = {phase: float('inf') for phase in PHASES}
+
+    def record(phase: str, function: Callable):
+        start = time.perf_counter()
+        result = function()
+        timings[phase] = min(timings[phase], time.perf_counter() - start)
+        return result
+
+    sizes = {}
+    for _ in range(repeat):
+        postfix = record('parse', lambda: build.to_postfix(regex))
+        # repeated subexpressions are shared, the same as in build.compile_regex
+        builder = ThompsonBuilder()
+        nfa: NFA = record('thompson', lambda: builder.to_nfa(build.evaluate(postfix, builder, True)))
+        sizes['thompson_states'] = len(nfa.states)
+
+        record('remove_epsilon', nfa.remove_epsilon)
+        record('reduce', nfa.reduce)
+        sizes['states'] = len(nfa.states)
+        sizes['transitions'] = sum(len(destinations) for state_transitions in nfa.transitions.values()
+                                   for destinations in state_transitions.values())
+
+        record('serialize', lambda: serialization.loads(serialization.dumps(nfa)))
+        record('simulate', lambda: run.simulate(input_string, nfa))
+        record('simulate_lazy', lambda: LazyDFA(nfa).simulate(input_string))
+
+    return {'regex_length': len(regex), 'input_length': len(input_string), **sizes, 'phases': timings}
+
+
+def run_benchmarks(scale: float = 1.0, repeat: int = DEFAULT_REPEAT, names: Optional[List[str]] = None) -> dict:
+    results = {}
+    for name, (regex_generator, size, input_generator) in WORKLOADS.items():
+        if names and name not in names:
+            continue
+        regex = regex_generator(max(1, int(size * scale)))
+        results[name] = benchmark_workload(regex, input_generator(int(INPUT_LENGTH * scale)), repeat)
+        print(f"{name}: " + ', '.join(f"{phase} {seconds:.4f}s" for phase, seconds in results[name]['phases'].items()),
+              file=sys.stderr)
+
+    return {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'python': platform.python_version(),
+        'scale': scale,
+        'workloads': results,
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Returns a description of every phase that got more than `threshold` times slower than in the baseline.
+    Workloads and phases missing from either side are skipped, so the suite can grow.
+    """
+    if baseline.get('version') != results['version'] or baseline.get('scale') != results['scale']:
+        raise ValueError("Baseline was recorded with another format version or scale")
+
+    regressions = []
+    for name, workload in results['workloads'].items():
+        baseline_phases = baseline['workloads'].get(name, {}).get('phases', {})
+        for phase, seconds in workload['phases'].items():
+            baseline_seconds = baseline_phases.get(phase)
+            if baseline_seconds is None or max(seconds, baseline_seconds) < MIN_COMPARED_TIME:
+                continue
+            if seconds > baseline_seconds * threshold:
+                regressions.append(f"{name}/{phase}: {seconds:.4f}s, baseline {baseline_seconds:.4f}s "
+                                   f"({seconds / baseline_seconds:.2f}x)")
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Times every phase of building and simulating automata for "
+                                                 "generated regexes and prints the results as JSON")
+    parser.add_argument('--output', help="file the JSON results are written to, stdout if omitted")
+    parser.add_argument('--baseline', help="JSON results of an earlier run, exit with status 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown factor against the baseline reported as a regression")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies the size of every workload")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per phase, the fastest is kept")
+    parser.add_argument('--workload', action='append', choices=list(WORKLOADS),
+                        help="run only this workload, may be repeated")
+    parser.add_argument('--legacy-epsilon', action='store_true',
+                        help="compare remove_epsilon with its previous implementation instead")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.legacy_epsilon:
+        benchmark_remove_epsilon()
+        return
+
+    results = run_benchmarks(args.scale, args.repeat, args.workload)
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
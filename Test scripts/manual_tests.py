@@ -1,6 +1,31 @@
-from automaton import NFA, EPSILON, get_states_list
+import asyncio
+import contextlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from alphabet import AlphabetPartition
+from cache import AutomatonCache, normalize_regex
+from metrics import Metrics
+from automaton import NFA, EPSILON, StateIds, ThompsonBuilder, get_states_list
+from bitparallel import BitParallelNFA
+from compact import CompactNFA
+from dfa import LazyDFA, DFAStateLimitError, determinize, minimize
+import batch
+import incremental
+import multipattern
+import parallel
+import search
+import serialization
+import stream
+import vectorized
 import build
+import client
 import run
+import server
 
 
 def test_nfa_to_string():
@@ -125,6 +150,28 @@ def test_nfa_reduce():
     print(nfa)
 
 
+def test_nfa_reduce_dead_states():
+    # 2 can not reach the accept state, 3 is only reachable through it
+    nfa = NFA([0, 1, 2, 3, 4], {'a', 'b'}, {0: {'a': {2, 4}, 'b': {2}}, 2: {'a': {3}}, 3: {'b': {2}}, 4: {'b': {1}}},
+              0, {1})
+    nfa.reduce()
+    assert nfa.states == [0, 1, 2]
+    assert nfa.transitions == {0: {'a': {2}}, 2: {'b': {1}}}
+    assert nfa.start_state == 0 and nfa.accept_states == {1}
+
+    # the start state is kept even if nothing is accepted
+    nfa = NFA([5, 6], {'a'}, {5: {'a': {6}}}, 5, set())
+    nfa.reduce()
+    assert nfa.states == [0] and nfa.transitions == {} and nfa.start_state == 0
+
+    # reducing large automata is linear, dead states are removed before renaming
+    nfa = build.regex_to_nfa('(ab|c)*d' * 2000)
+    nfa.remove_epsilon()
+    nfa.accept_states = set()
+    nfa.reduce()
+    assert nfa.states == [0] and not nfa.accept_states
+
+
 def test_nfa_remove_epsilon_and_reduce():
     # public test #1
     nfa = NFA([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12], {1, 0, EPSILON, 'o', 'r', 'y'}, {
@@ -220,23 +267,162 @@ def test_nfa():
     test_nfa_remove_unreachable_states()
     test_nfa_remove_epsilon_and_unreachable()
     test_nfa_reduce()
+    test_nfa_reduce_dead_states()
     test_nfa_remove_epsilon_and_reduce()
     test_nfa_concatenation()
     test_nfa_kleene_star()
     test_nfa_alternation()
 
 
-def test_build_format_epsilon():
-    assert build.format_epsilon(['(', 'a', '|', '(', ')', ')']) == ['(', 'a', '|', EPSILON, ')']
-    assert build.format_epsilon(['a', '(', ')', 'b']) == ['a', EPSILON, 'b']
-    assert build.format_epsilon(['a', 'b', 'c']) == ['a', 'b', 'c']
-    assert build.format_epsilon([]) == []
-    assert build.format_epsilon(['(']) == ['(']
-    assert build.format_epsilon([')', '(']) == [')', '(']
+def test_build_state_ids():
+    # every compilation numbers its states from 0, whatever was compiled before
+    nfa = build.regex_to_nfa('(ab|c)*d')
+    assert sorted(nfa.states) == list(range(len(nfa.states)))
+    assert str(build.regex_to_nfa('(ab|c)*d')) == str(nfa)
+
+    ids = StateIds(10)
+    assert ids.new() == 10 and ids.new_list(3) == [11, 12, 13] and len(ids) == 14
+    builder = ThompsonBuilder(ids)
+    assert builder.symbol('a') == (14, 15)
+
+    # compilations in a thread pool share no state and give the same automata as sequential ones
+    regexes = ['(ab|c)*d', 'a{2,5}[b-y]+', '(x|y|z)*xyz', '\\d+(\\.\\d*)?'] * 25
+    expected = [str(build.compile_regex(regex)) for regex in regexes]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert [str(nfa) for nfa in executor.map(build.compile_regex, regexes)] == expected
+
+
+def test_build_shared_subexpressions():
+    # (ab|cd)* and its parts occur three times, the later occurrences start at tokens 10 and 21
+    # and are copied as a whole
+    postfix = build.to_postfix('(ab|cd)*x(ab|cd)*y(ab|cd)*')
+    repeated = build.shared_subexpressions(postfix)
+    assert sorted(repeated) == [0, 10, 21]
+    assert [end for end, _ in repeated[0]] == [7] and [end for end, _ in repeated[21]] == [28]
+    assert repeated[10][0][1] == repeated[0][0][1]
+    assert build.shared_subexpressions(postfix, min_tokens=9) == {}
+
+    # building a template costs about as much as building a subexpression that occurs only twice again
+    postfix = build.to_postfix('(ab|cd)*x(ab|cd)*')
+    assert build.shared_subexpressions(postfix) == {}
+    assert sorted(build.shared_subexpressions(postfix, min_occurrences=2)) == [0, 10]
+    assert build.shared_subexpressions(build.to_postfix('(ab|cd){3,10}')) == {}
+
+    # later occurrences are copies of the epsilon-free first one, so the automaton is smaller
+    regex = '((ab|cd)*e(f|g)+h)' * 20
+    builder = ThompsonBuilder()
+    shared = builder.to_nfa(build.evaluate(build.to_postfix(regex), builder, share_subexpressions=True))
+    plain = build.regex_to_nfa(regex)
+    assert len(shared.states) < len(plain.states) / 2
+
+    shared.remove_epsilon()
+    shared.reduce()
+    plain.remove_epsilon()
+    plain.reduce()
+    assert len(shared.states) == len(plain.states)
+    for input_string in ["abefh" * 20, "cdegfh" * 20, "abefh" * 19 + "abeh", "eghefh" * 10]:
+        assert run.simulate(input_string, shared) == run.simulate(input_string, plain)
+
+    # compile_regex shares subexpressions
+    regex = '(a{2,3}|[b-d]+x)' * 10
+    plain = build.regex_to_nfa(regex)
+    plain.remove_epsilon()
+    plain.reduce()
+    input_string = "aaabcxaacx" * 2 + "aabx"
+    assert run.simulate(input_string, build.compile_regex(regex)) == run.simulate(input_string, plain)
+    assert run.simulate(input_string, plain)[-1] == 'Y'
+
+
+def test_build_thompson():
+    builder = ThompsonBuilder()
+    a, b = builder.symbol('a'), builder.symbol('b')
+    nfa = builder.to_nfa(builder.kleene_star(builder.alternation(builder.concatenation(a, b), builder.symbol('c'))))
+    assert nfa.states[0] == nfa.start_state
+    nfa.remove_epsilon()
+    nfa.reduce()
+    assert run.simulate("abcabac", nfa) == "NYYNYNN"
+
+    nfa = build.regex_to_nfa('(ab|c)*d')
+    nfa.remove_epsilon()
+    nfa.reduce()
+    assert run.simulate("abcdd", nfa) == "NNNYN"
+
+    # long regexes are built in linear time
+    nfa = build.regex_to_nfa('(ab|c)*' * 10000)
+    assert len(nfa.states) == 100000
+
+
+def test_build_to_postfix():
+    concatenation, alternation, kleene_star = build.CONCATENATION, build.ALTERNATION, build.KLEENE_STAR
+    assert build.to_postfix('(ab|c)*') == ['a', 'b', concatenation, 'c', alternation, kleene_star]
+    assert build.to_postfix('a|bc*') == ['a', 'b', 'c', kleene_star, concatenation, alternation]
+    assert build.to_postfix('a()b') == ['a', EPSILON, concatenation, 'b', concatenation]
+    assert build.to_postfix('') == [EPSILON]
+
+    for regex, position in [('a|', 1), ('(a', 0), ('a)', 1), ('*a', 0), ('(|a)', 1), ('(a|)', 2), ('a(*)', 2),
+                            ('((a)', 0), ('())', 2)]:
+        try:
+            build.to_postfix(regex)
+            assert False
+        except build.RegexSyntaxError as error:
+            assert error.position == position
+
+    # deep nesting does not hit the recursion limit
+    nfa = build.compile_regex('(' * 100000 + 'a' + ')' * 100000 + '*')
+    assert run.simulate("aaa", nfa) == "YYY"
+
+
+def test_build_extended_syntax():
+    for regex, input_string, expected in [('[a-c]+d?', "abcdd", "YYYYN"), ('a{2,3}', "aaaa", "NYYN"),
+                                          ('(ab){2,}', "ababab", "NNNYNY"), ('x?y', "xyy", "NYN"),
+                                          ('.[^a]\\d', "xb1a", "NNYN"), ('\\w\\s\\*', "a *", "NNY"),
+                                          ('[]\\]-]{2}', "]-", "NY"), ('a{0}b', "b", "Y"), ('\\x41\\u00e4', "Aä", "NY")]:
+        nfa = build.compile_regex(regex)
+        assert run.simulate(input_string, nfa) == expected
+        assert run.simulate(input_string, build.regex_to_dfa(regex)) == expected
+        assert run.simulate(input_string, run.read_nfa(io.StringIO(str(nfa)))) == expected
+
+    # a class is a single transition instead of one transition per character
+    nfa = build.compile_regex('[a-z]')
+    assert sum(len(symbols) for symbols in nfa.transitions.values()) == 1
+
+    # overlapping labels are split into disjoint ranges by subset construction
+    dfa = build.regex_to_dfa('[a-z]*e[a-z]')
+    assert run.simulate("xeyee", dfa) == "NNYNY"
+    assert all(len(destinations) == 1 for symbols in dfa.transitions.values() for destinations in symbols.values())
+
+    # bounded repetition stays linear in the count
+    nfa = build.compile_regex('(ab|c){0,1000}')
+    assert len(nfa.states) <= 3001
+    assert run.simulate("ab" * 1000 + "c", nfa) == "NY" * 1000 + "N"
+
+    for regex, position in [('a{3,2}', 1), ('[a', 0), ('a{', 1), ('a{x}', 1), ('+a', 0), ('[z-a]', 1), ('a\\', 1),
+                            ('a{1001}', 1), ('(?a)', 1), ('a**', 2), ('a+?', 2), ('a{2}{3}', 4), ('a{0,1000}{0,1000}', 9)]:
+        try:
+            build.to_postfix(regex)
+            assert False
+        except build.RegexSyntaxError as error:
+            assert error.position == position
+    assert build.to_postfix('(a*)*') == ['a', build.KLEENE_STAR, build.KLEENE_STAR]
+
+    # nested repetition multiplies the copies, their total is limited before they are built
+    # copies of shared subexpressions count as well, so sharing does not change which regexes are rejected
+    for regex, position in [('(a{400}){400}', 8), ('(a{0,1000}){0,1000}', 11), ('x(a{50}b){20}' * 100, 646)]:
+        for compile_function in (build.compile_regex, build.regex_to_nfa):
+            try:
+                compile_function(regex)
+                assert False
+            except build.RegexSyntaxError as error:
+                assert error.position == position
+    assert len(build.compile_regex('(a{200}){200}').states) == 40001
 
 
 def test_build():
-    test_build_format_epsilon()
+    test_build_state_ids()
+    test_build_to_postfix()
+    test_build_thompson()
+    test_build_shared_subexpressions()
+    test_build_extended_syntax()
 
 
 def test_run():
@@ -258,10 +444,528 @@ def test_run():
     assert run.simulate("abbc1acabbbbc001cabc", nfa) == "NNNYYNYNNNNNYYYYNNNN"
 
 
+def test_run_simulation_tables():
+    nfa = build.compile_regex('[a-c]x|y')
+    assert run.simulate("bxy", nfa) == "NYN"
+    tables = nfa.simulation_tables()
+    assert set(tables.class_transitions) == {nfa.start_state}
+
+    # the tables are computed once per automaton, not on every simulation
+    calls = []
+    nfa.class_transitions = lambda: calls.append(1) or NFA.class_transitions(nfa)
+    assert run.simulate("cx", nfa) == "NY" and run.simulate("y", nfa) == "Y"
+    assert not calls and nfa.simulation_tables() is tables
+
+    # replacing an attribute or changing the automaton with a method computes them again
+    nfa.accept_states = set()
+    assert run.simulate("cx", nfa) == "NN" and len(calls) == 1
+    nfa.discard_simulation_tables()
+    assert nfa.simulation_tables() is not tables and len(calls) == 2
+
+    # a large automaton is analysed by the first call only, later short inputs cost no pass over it
+    nfa = build.compile_regex('(ab|c)*d' * 2000)
+    passes = []
+    nfa._predecessors = lambda: passes.append(1) or NFA._predecessors(nfa)
+    for _ in range(100):
+        assert run.simulate("a", nfa) == "N" and not run.accepts("c", nfa) and run.first_match("d", nfa) == -1
+    assert len(passes) == 1
+
+    # they are not stored with the automaton
+    nfa = pickle.loads(pickle.dumps(build.compile_regex('[a-c]x|y')))
+    assert nfa._simulation_tables is None and run.simulate("ax", nfa) == "NY"
+
+
+def test_run_early_exit():
+    # 3 can not reach the accept state 2, 4 accepts everything after it
+    nfa = NFA([0, 1, 2, 3, 4], {'a', 'b', '.'}, {0: {'a': {1, 3}, 'b': {4}}, 1: {'b': {2}}, 3: {'b': {3}},
+                                                  4: {build.ESCAPE_CLASSES['d'].negated(): {4}, '0': {4},
+                                                      build.ESCAPE_CLASSES['d']: {4}}}, 0, {2, 4})
+    assert nfa.co_reachable_states() == {0, 1, 2, 4}
+    assert nfa.accept_absorbing_states() == {4}
+
+    metrics = Metrics()
+    assert run.simulate("abbbb", nfa, metrics) == "NYNNN"
+    assert metrics.counters['simulate.skipped_characters'] == 2
+    assert run.simulate("bx7", nfa, metrics) == "YYY"
+    assert metrics.counters['simulate.skipped_characters'] == 4
+    assert run.simulate("", nfa) == ""
+
+    assert run.accepts("ab", nfa) and not run.accepts("abb", nfa) and not run.accepts("", nfa)
+    assert run.accepts("b" + "x" * 1000, nfa)
+    assert run.first_match("aab", nfa) == -1 and run.first_match("ab", nfa) == 1 and run.first_match("", nfa) == -1
+
+    # compact automata, as loaded from binary files, are simulated by themselves
+    compact_nfa = CompactNFA.from_nfa(nfa)
+    assert run.accepts("ab", compact_nfa) and not run.accepts("abb", compact_nfa) and not run.accepts("", compact_nfa)
+    assert run.first_match("aab", compact_nfa) == -1 and run.first_match("bx", compact_nfa) == 0
+
+    # states after .* accept everything, states of (a|b)* do not
+    assert build.compile_regex('ab.*').accept_absorbing_states() == {2, 3}
+    assert build.compile_regex('(a|b)*').accept_absorbing_states() == set()
+    nfa = build.compile_regex('x(a|[^a])*')
+    assert run.simulate("xyz", nfa) == "YYY" and run.simulate("yxz", nfa) == "NNN"
+
+
+def test_run_lazy():
+    nfa = NFA([0, 1, 2], {'a', 'b', 'c', '0', '1'}, {0: {'a': {1}}, 1: {'b': {1}, 'c': {2}},
+                                                     2: {'a': {1}, '0': {2}, '1': {2}}}, 0, {0, 2})
+    assert run.simulate_lazy("abbc1acabbbbc001cabc", nfa) == "NNNYYNYNNNNNYYYYNNNN"
+    assert run.simulate_lazy("", nfa) == ""
+
+    nfa = NFA([0, 1, 2, 3], {'a', 'b'}, {0: {'a': {0, 1}, 'b': {0}}, 1: {'b': {2}}, 2: {'a': {3}}}, 0, {3})
+    input_string = "abaababbaba" * 10
+    assert run.simulate_lazy(input_string, nfa) == run.simulate(input_string, nfa)
+
+    # tiny cache forces flushes, the result must stay the same
+    lazy_dfa = LazyDFA(nfa, cache_size=2)
+    assert lazy_dfa.simulate(input_string) == run.simulate(input_string, nfa)
+    assert lazy_dfa.flush_count > 0
+    assert len(lazy_dfa) <= 2
+
+
+def test_dfa_minimize():
+    # (a|b)*a(a|b) needs 4 states in the minimal DFA
+    dfa = build.regex_to_dfa('(a|b)*a(a|b)')
+    assert len(dfa.states) == 4
+    assert run.simulate("abaabba", dfa) == "NYNYYNN"
+
+    # equivalent states 1 and 2 are merged, dead state 3 is dropped
+    nfa = NFA([0, 1, 2, 3], {'a', 'b'}, {0: {'a': {1}, 'b': {2}}, 1: {'a': {1}}, 2: {'a': {2}}, 3: {'b': {0}}}, 0, {1, 2})
+    dfa = minimize(determinize(nfa))
+    assert len(dfa.states) == 2
+    assert run.simulate("aaa", dfa) == "YYY"
+    assert run.simulate("baab", dfa) == "YYYN"
+
+    # empty language
+    dfa = minimize(determinize(NFA([0, 1], {'a'}, {0: {'a': {1}}}, 0, set())))
+    assert len(dfa.states) == 1 and not dfa.accept_states
+
+    try:
+        build.regex_to_dfa('(a|b)*a(a|b)(a|b)(a|b)(a|b)', max_states=10)
+        assert False
+    except DFAStateLimitError:
+        pass
+
+
+def test_run_compact():
+    nfa = NFA([0, 1, 2], {'a', 'b', 'c', '0', '1'}, {0: {'a': {1}}, 1: {'b': {1}, 'c': {2}},
+                                                     2: {'a': {1}, '0': {2}, '1': {2}}}, 0, {0, 2})
+    compact_nfa = CompactNFA.from_nfa(nfa)
+    assert run.simulate("abbc1acabbbbc001cabc", compact_nfa) == "NNNYYNYNNNNNYYYYNNNN"
+    assert run.simulate("", compact_nfa) == ""
+
+    # converting back gives the same automaton
+    nfa_copy = compact_nfa.to_nfa()
+    assert nfa_copy.states == nfa.states
+    assert nfa_copy.transitions == nfa.transitions
+    assert nfa_copy.accept_states == nfa.accept_states
+
+    # the arrays grow with the transitions, not with the states times the symbols
+    assert list(compact_nfa.offsets) == [0, 1, 3, 6]
+    assert [compact_nfa.symbols[label] for label in compact_nfa.labels] == ['a', 'b', 'c', '0', '1', 'a']
+    regex = ''.join(chr(ord('a') + i % 26) + chr(0x100 + i) for i in range(500))
+    compact_nfa = CompactNFA.from_nfa(build.compile_regex(regex))
+    assert len(compact_nfa.symbols) > 500 and len(compact_nfa.offsets) == 1002
+    assert len(compact_nfa.targets) == len(compact_nfa.labels) == 1000
+    assert run.simulate(regex, compact_nfa) == "N" * 999 + "Y"
+
+    try:
+        compact_nfa.start_state = 1
+        assert False
+    except AttributeError:
+        pass
+
+
+def test_run_bitparallel():
+    nfa = NFA([0, 1, 2], {'a', 'b', 'c', '0', '1'}, {0: {'a': {1}}, 1: {'b': {1}, 'c': {2}},
+                                                     2: {'a': {1}, '0': {2}, '1': {2}}}, 0, {0, 2})
+    assert run.simulate_bitparallel("abbc1acabbbbc001cabc", nfa) == "NNNYYNYNNNNNYYYYNNNN"
+    assert run.simulate_bitparallel("", nfa) == ""
+
+    # state 1 is entered with both 'a' and 'b', so the automaton is not homogeneous
+    nfa = NFA([0, 1, 2], {'a', 'b'}, {0: {'a': {1}, 'b': {0}}, 1: {'b': {1, 2}}, 2: {'a': {0}}}, 0, {2})
+    assert not BitParallelNFA(nfa).homogeneous
+    assert run.simulate_bitparallel("abbabab", nfa) == run.simulate("abbabab", nfa)
+
+    # NFAs built from regexes are homogeneous, more than 8 states use several chunks
+    nfa = build.regex_to_nfa('((ab|c)*d|a(bd)*)*')
+    nfa.remove_epsilon()
+    nfa.reduce()
+    assert BitParallelNFA(nfa).homogeneous
+    input_string = "abcdabdbdcdaabd" * 5
+    assert run.simulate_bitparallel(input_string, nfa) == run.simulate(input_string, nfa)
+
+
+def test_batch():
+    inputs = ["abcd", "cd", "", "abab", "x"]
+    assert list(batch.match_regex('(ab|c)*d', inputs)) == ["NNNY", "NY", "", "NNNN", "N"]
+
+    nfa = build.compile_regex('(11|aa)*')
+    output = io.StringIO()
+    batch.match_lines(nfa, io.StringIO("11aa\n1\naa1\n"), output)
+    assert output.getvalue() == "NYNY\nN\nNYN\n"
+
+    # options that would be ignored in combination are rejected
+    argv = sys.argv
+    try:
+        for arguments in (['--dfa', '--cache-dir', 'cache'], ['--workers', '2', '--vectorized'],
+                          ['--workers', '2', '--stats']):
+            sys.argv = ['batch.py', 'a*'] + arguments
+            try:
+                with contextlib.redirect_stderr(io.StringIO()):
+                    batch.parse_args()
+            except SystemExit as error:
+                assert error.code == 2
+            else:
+                assert False, arguments
+        sys.argv = ['batch.py', 'a*', '--vectorized', '--stats']
+        assert batch.parse_args().vectorized
+    finally:
+        sys.argv = argv
+
+
+def test_parallel():
+    nfa = build.compile_regex('(ab|c)*d')
+    inputs = ["abcd", "cd", "", "abab", "x"] * 20
+    expected = list(batch.match_many(nfa, inputs))
+    assert list(parallel.match_parallel(nfa, inputs, workers=2, chunk_size=7)) == expected
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'inputs.txt')
+        with open(path, 'w') as input_file:
+            input_file.write('\n'.join(inputs))
+
+        # ranges cover the whole file and end on line boundaries
+        ranges = parallel.file_ranges(path, chunk_bytes=16)
+        assert ranges[0][0] == 0 and ranges[-1][1] == os.path.getsize(path)
+
+        results = ''.join(parallel.match_file_parallel(nfa, path, workers=2, chunk_bytes=16))
+        assert results == ''.join(result + '\n' for result in expected)
+
+        # CRLF line breaks give the same results as in text mode
+        with open(path, 'w', newline='\r\n') as input_file:
+            input_file.write('\n'.join(inputs) + '\n')
+        results = ''.join(parallel.match_file_parallel(nfa, path, workers=2, chunk_bytes=16))
+        assert results == ''.join(result + '\n' for result in expected)
+
+
+def test_stream():
+    nfa = build.compile_regex('(ab|c)*d')
+    input_string = "abcdabdccd" * 3
+    expected = run.simulate(input_string, nfa)
+
+    chunks = [input_string[i:i + 4] for i in range(0, len(input_string), 4)]
+    assert ''.join(stream.simulate_chunks(nfa, chunks)) == expected
+    assert list(stream.match_offsets(nfa, chunks)) == [i for i in range(len(expected)) if expected[i] == 'Y']
+
+    # multi-byte characters split between chunks
+    nfa = NFA([0, 1, 2], {'ä', 'b'}, {0: {'ä': {1}}, 1: {'b': {2}}, 2: {'ä': {1}}}, 0, {2})
+    assert list(stream.read_chunks(io.BytesIO('äbäb'.encode()), chunk_size=1)) == ['', 'ä', 'b', '', 'ä', 'b']
+    assert ''.join(stream.simulate_chunks(nfa, stream.read_chunks(io.BytesIO('äbäb'.encode()), 1))) == "NYNY"
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'input.txt')
+        with open(path, 'w') as input_file:
+            input_file.write('äbäbb')
+        assert ''.join(stream.simulate_chunks(nfa, stream.mmap_chunks(path, chunk_size=3))) == "NYNYN"
+
+        open(path, 'w').close()
+        assert list(stream.mmap_chunks(path)) == []
+
+
+def test_incremental():
+    nfa = build.compile_regex('(ab|c)*d')
+    matcher = incremental.compile_matcher('(ab|c)*d')
+    assert not matcher.is_accepting()
+    assert not matcher.feed("a")
+    assert matcher.feed_results("bcd") == "NNY" and matcher.is_accepting()
+    checkpoint = matcher.snapshot()
+    assert not matcher.feed("x")
+    matcher.restore(checkpoint)
+    assert matcher.is_accepting()
+    matcher.reset()
+    assert matcher.feed("cd")
+
+    # interleaved streams share the DFA, checkpoints stay valid when the small cache is flushed
+    lazy_dfa = LazyDFA(nfa, cache_size=2)
+    inputs = ["abababcd", "ccccd", "abxd", "cabd"]
+    matchers = [incremental.Matcher(lazy_dfa) for _ in inputs]
+    results = ["" for _ in inputs]
+    for position in range(0, 8, 3):
+        for i, input_string in enumerate(inputs):
+            results[i] += matchers[i].feed_results(input_string[position:position + 3])
+    assert results == [run.simulate(input_string, nfa) for input_string in inputs]
+    assert lazy_dfa.flush_count > 0
+
+    matcher = incremental.Matcher(lazy_dfa)
+    matcher.feed("ab")
+    copy = matcher.copy()
+    assert not copy.feed("c") and copy.feed("d") and not matcher.is_accepting()
+    copy.restore(matchers[0].snapshot())
+    assert copy.is_accepting()
+
+
+def test_cache():
+    assert normalize_regex('((ab|c)*d)') == '(ab|c)*d'
+    assert normalize_regex(' ((ab|c)*d) ') == ' ((ab|c)*d) '
+    assert normalize_regex('(a)|(b)') == '(a)|(b)'
+    assert normalize_regex('(())') == '()'
+
+    automaton_cache = AutomatonCache(max_entries=2)
+    nfa = automaton_cache.get('(ab|c)*d')
+    assert automaton_cache.get('((ab|c)*d)') is nfa
+    assert run.simulate("abcd", nfa) == "NNNY"
+    automaton_cache.get('a')
+    automaton_cache.get('b')
+    assert '(ab|c)*d' not in automaton_cache
+    assert automaton_cache.stats() == {'entries': 2, 'hits': 1, 'misses': 3, 'evictions': 1,
+                                       'disk_hits': 0, 'disk_writes': 0}
+
+    # spaces are literals, a regex with a trailing space is a different regex
+    automaton_cache = AutomatonCache()
+    assert normalize_regex('a') != normalize_regex('a ')
+    assert automaton_cache.get('a') is not automaton_cache.get('a ')
+    assert run.simulate("a ", automaton_cache.get('a ')) == "NY"
+    assert run.simulate("a ", automaton_cache.get('a\\ ')) == "NY"
+
+    with tempfile.TemporaryDirectory() as directory:
+        automaton_cache = AutomatonCache(directory=directory)
+        automaton_cache.get('(11|aa)*')
+        assert automaton_cache.disk_writes == 1
+
+        # another cache (as in another process) loads the automaton from disk
+        automaton_cache = AutomatonCache(directory=directory)
+        nfa = automaton_cache.get('(11|aa)*')
+        assert automaton_cache.disk_hits == 1
+        assert run.simulate("11aa1", nfa) == "NYNYN"
+
+        # files hold the automaton in the binary format, never pickles, so a damaged or crafted file is a miss
+        name, = os.listdir(directory)
+        with open(os.path.join(directory, name), 'rb') as cache_file:
+            assert b'R2NB' in cache_file.read()
+        with open(os.path.join(directory, name), 'r+b') as cache_file:
+            cache_file.seek(6)
+            cache_file.write(pickle.dumps(('(11|aa)*', nfa)))
+        automaton_cache = AutomatonCache(directory=directory)
+        assert run.simulate("11aa1", automaton_cache.get('(11|aa)*')) == "NYNYN"
+        assert automaton_cache.disk_hits == 0 and automaton_cache.disk_writes == 1
+
+        # files of another format version are ignored
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name), 'r+b') as cache_file:
+                cache_file.write(b'R2NC\xff\xff')
+        automaton_cache = AutomatonCache(directory=directory)
+        automaton_cache.get('(11|aa)*')
+        assert automaton_cache.disk_hits == 0 and automaton_cache.disk_writes == 1
+
+
+def test_serialization():
+    nfa = NFA([0, 1, 2], {'a', 'b', 'c', '0', '1'}, {0: {'a': {1}}, 1: {'b': {1}, 'c': {2}},
+                                                     2: {'a': {1}, '0': {2}, '1': {2}}}, 0, {0, 2})
+    data = serialization.dumps(nfa)
+    assert serialization.is_binary(data)
+
+    compact_nfa = serialization.loads(data)
+    assert run.simulate("abbc1acabbbbc001cabc", compact_nfa) == "NNNYYNYNNNNNYYYYNNNN"
+    nfa_copy = compact_nfa.to_nfa()
+    assert nfa_copy.transitions == nfa.transitions and nfa_copy.accept_states == nfa.accept_states
+
+    # multi-byte symbols and loading from a memory-mapped file
+    nfa = build.compile_regex('(äb|c)*')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'nfa.bin')
+        with open(path, 'wb') as nfa_file:
+            serialization.write_binary(nfa, nfa_file)
+        assert run.simulate("äbcäbc", serialization.load_file(path)) == "NYYNYY"
+
+    for bad_data in (b'', b'R2NA' + data[4:], data[:-4]):
+        try:
+            serialization.loads(bad_data)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_alphabet():
+    # 'a' and 'A' behave the same in the DFA, [b-z] is one class, everything else matches nothing
+    alphabet = AlphabetPartition.from_nfa(build.regex_to_dfa('(a|A)*[b-z]'))
+    assert len(alphabet) == 3
+    assert alphabet.class_of('a') == alphabet.class_of('A') != 0
+    assert alphabet.class_of('b') == alphabet.class_of('z') != alphabet.class_of('a')
+    assert alphabet.class_of('B') == alphabet.class_of('\u20ac') == 0
+    assert list(alphabet.translate("aAbB")) == [alphabet.class_of(ch) for ch in "aAbB"]
+    assert alphabet.class_label(alphabet.class_of('a')) == build.parse_class('[aA]', 0)[0]
+
+    # the lazy DFA computes one transition per class instead of one per character
+    nfa = build.compile_regex('.*x')
+    lazy_dfa = LazyDFA(nfa)
+    input_string = "".join(chr(code) for code in range(32, 5000) if code != ord('x')) + "x"
+    assert lazy_dfa.simulate(input_string) == "N" * 4967 + "Y"
+    assert len(lazy_dfa.alphabet) == 3 and len(lazy_dfa) == 3
+
+    # an NFA read from the text format knows its alphabet
+    nfa = run.read_nfa(io.StringIO(str(build.compile_regex('a[0-9]'))))
+    assert nfa.symbols == {'a', build.parse_class('[0-9]', 0)[0]}
+
+
+def test_vectorized():
+    nfa = build.compile_regex('[A-Z]{2}[0-9]+|ab*')
+    inputs = ["AB123", "abbbb", "ZZ9ZZ", "", "a", "AB", "xyz12", "ABC12"]
+    expected = [run.simulate(input_string, nfa) for input_string in inputs]
+    assert vectorized.match_matrix(nfa, inputs) == expected
+    assert vectorized.match_matrix(nfa, []) == []
+
+    dense_dfa = vectorized.compile_dense(nfa)
+    if vectorized.numpy is None:
+        # without NumPy the lazy DFA is used
+        assert dense_dfa is None
+    else:
+        assert dense_dfa.match(inputs) == expected
+        fixed_width = ["AB123", "abbbb", "ZZ9ZZ", "AB12a"] * 3
+        assert dense_dfa.match(fixed_width) == [run.simulate(input_string, nfa) for input_string in fixed_width]
+        assert dense_dfa.accept_matrix(["AB1", "ab"]).tolist() == [[False, False, True], [True, True, False]]
+
+    # DFAs larger than the limit are not built
+    assert vectorized.compile_dense(build.compile_regex('(a|b)*a(a|b){10}'), max_states=100) is None
+
+    output = io.StringIO()
+    metrics = Metrics()
+    batch.match_lines_vectorized(nfa, io.StringIO('\n'.join(inputs) + '\n'), output, chunk_size=3, metrics=metrics)
+    assert output.getvalue() == ''.join(result + '\n' for result in expected)
+    assert ('lazy_dfa.states' if dense_dfa is None else 'dense_dfa.states') in metrics.counters
+
+
+def test_multipattern():
+    multi_dfa = multipattern.compile_patterns(['a+b', '(ab|c)*', '[a-c]{2}', ''])
+    assert multi_dfa.match_positions("abc") == [frozenset(), frozenset({0, 1, 2}), frozenset({1})]
+    assert list(multi_dfa.scan("cab")) == [(0, frozenset({1})), (1, frozenset({2})), (2, frozenset({1}))]
+    assert multi_dfa.fullmatch("ab") == frozenset({0, 1, 2})
+    assert multi_dfa.fullmatch("") == frozenset({1, 3})
+    assert multi_dfa.matched_patterns("aab") == {0, 2}
+
+    # without patterns nothing matches
+    multi_dfa = multipattern.compile_patterns([])
+    assert multi_dfa.match_positions("ab") == [frozenset(), frozenset()] and multi_dfa.fullmatch("") == frozenset()
+    assert multipattern.compile_patterns(['', '']).fullmatch("") == frozenset({0, 1})
+
+    # patterns are matched in a single pass, even with a tiny cache that is flushed all the time
+    regexes = ['x' * i + '[a-z]*' for i in range(1, 51)]
+    multi_dfa = multipattern.compile_patterns(regexes, cache_size=2)
+    assert multi_dfa.fullmatch("x" * 30 + "y") == frozenset(range(30))
+    assert multi_dfa.flush_count > 0
+
+
+def test_search():
+    searcher = search.compile_searcher('abcd|c')
+    # the leftmost match wins even though 'c' ends first
+    assert searcher.find("xabcd") == (1, 5)
+    assert list(searcher.finditer("cabcdcc")) == [(0, 1), (1, 5), (5, 6), (6, 7)]
+    assert searcher.find("xyz") is None
+
+    # leftmost-longest and empty matches, as re.finditer reports them for these patterns
+    assert list(search.compile_searcher('a*').finditer("baab")) == [(0, 0), (1, 3), (3, 3), (4, 4)]
+    assert list(search.compile_searcher('(ab|a)(bc|c)?').finditer("abcab")) == [(0, 3), (3, 5)]
+
+    # the reversed NFA accepts the reversed strings
+    nfa = search.reverse_nfa(build.compile_regex('ab*c'))
+    assert run.simulate("cbba", nfa) == "NNNY"
+
+    # a tiny cache is flushed during the search without changing the result
+    searcher = search.compile_searcher('[0-9]+(\\.[0-9]+)?', cache_size=2)
+    assert list(searcher.finditer("v1.25 and 3.x")) == [(1, 5), (10, 11)]
+
+
+def test_metrics():
+    phases = []
+    metrics = Metrics(callback=lambda name, seconds: phases.append(name))
+    dfa = build.regex_to_dfa('(ab|c)*d', metrics=metrics)
+    assert phases == ['parse', 'thompson', 'remove_epsilon', 'reduce', 'determinize', 'minimize']
+    assert set(metrics.timings) == set(phases)
+    assert metrics.counters['minimize.states'] == len(dfa.states) == 3
+    assert metrics.counters['thompson.states'] >= metrics.counters['reduce.states']
+
+    nfa = build.compile_regex('(a|b)*a(a|b)')
+    assert run.simulate("abab", nfa, metrics) == "NYNY"
+    assert metrics.counters['simulate.characters'] == 4
+    assert metrics.counters['simulate.peak_active_states'] == 2
+
+    # the lazy DFA computes each transition once, the rest are cache hits
+    assert run.simulate_lazy("abababab", nfa, metrics=metrics) == "NYNYNYNY"
+    assert metrics.counters['lazy_dfa.computed_transitions'] == 3
+    assert metrics.counters['lazy_dfa.hit_rate'] == 5 / 8
+
+    metrics = Metrics()
+    assert list(batch.match_many(nfa, ["ab", "ba"], metrics=metrics)) == ["NY", "NN"]
+    assert metrics.counters['lazy_dfa.steps'] == 4
+    assert 'lazy_dfa.steps' in metrics.report()
+
+
+def test_server():
+    regex_server = server.RegexServer(max_entries=2)
+    assert regex_server.handle({'id': 7, 'op': 'match', 'regex': '(ab|c)*d', 'input': 'abcd'}) == {'id': 7,
+                                                                                                 'result': 'NNNY'}
+    assert regex_server.handle({'op': 'match', 'regex': '((ab|c)*d)', 'inputs': ['cd', '']}) == {'result': ['NY', '']}
+    assert regex_server.handle({'op': 'search', 'regex': 'ab', 'input': 'xabyab'}) == {'result': [[1, 3], [4, 6]]}
+    assert regex_server.handle({'op': 'compile', 'regex': 'a(b'}) == {'error': "Unbalanced '(' at position 1",
+                                                                      'position': 1}
+    assert 'error' in regex_server.handle({'op': 'match', 'regex': 'a'})
+    assert 'error' in regex_server.handle({'op': 'delete'})
+    assert regex_server.handle_line(b'[1]\n') == b'{"error": "Request must be a JSON object"}\n'
+
+    # the automaton of an equivalent spelling is reused, only the least recently used regexes are kept
+    stats = regex_server.stats()
+    assert stats['entries'] == 2 and stats['lazy_dfas'] == 1 and stats['searchers'] == 1
+
+    # spaces in the regex are literals, also at its ends
+    assert regex_server.handle({'op': 'match', 'regex': ' ', 'input': ' '}) == {'result': 'Y'}
+    assert regex_server.handle({'op': 'match', 'regex': 'a ', 'inputs': ['a', 'a ']}) == {'result': ['N', 'NY']}
+    assert regex_server.handle({'op': 'search', 'regex': ' b', 'input': 'ab b'}) == {'result': [[2, 4]]}
+
+    async def round_trip(path: str) -> list:
+        serving = asyncio.create_task(server.serve_unix(regex_server, path))
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b'{"id": 1, "op": "match", "regex": "a*", "input": "aab"}\n{"id": 2, "op": "stats"}\n')
+        responses = [await reader.readline(), await reader.readline()]
+        writer.close()
+
+        # the blocking client is run in a thread, so the server can answer it
+        result = await asyncio.to_thread(client.request, {'op': 'match', 'regex': 'a*', 'input': 'ba'}, path)
+        serving.cancel()
+        return responses + [result]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'server.sock')
+        responses = asyncio.run(round_trip(path))
+        assert responses[0] == b'{"id": 1, "result": "YYN"}\n'
+        assert b'"id": 2' in responses[1]
+        assert responses[2] == "NN"
+        assert not os.path.exists(path)
+
+
 def main():
     test_nfa()
     test_build()
+    test_dfa_minimize()
     test_run()
+    test_run_simulation_tables()
+    test_run_early_exit()
+    test_run_lazy()
+    test_alphabet()
+    test_run_compact()
+    test_run_bitparallel()
+    test_batch()
+    test_vectorized()
+    test_multipattern()
+    test_search()
+    test_metrics()
+    test_parallel()
+    test_stream()
+    test_incremental()
+    test_cache()
+    test_serialization()
+    test_server()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+from automaton import NFA, EPSILON
+from charclass import CharClass, Symbol, label_ranges, split_ranges
+
+TABLE_SIZE = 256  # characters below this code point are classified by a direct table lookup
+MAX_TRANSLATED_CHARACTERS = 65536  # characters kept in the translation table before it is cleared
+
+# class of characters no transition is labeled with
+NO_MATCH_CLASS = 0
+
+
+class _TranslationTable(dict):
+    """
+    Mapping from code points to class ids as characters, for str.translate.
+    Code points are classified on first use, so the table only holds characters that occurred in the input.
+    """
+    def __init__(self, partition: 'AlphabetPartition') -> None:
+        super().__init__()
+        self.partition = partition
+
+    def __missing__(self, code: int) -> str:
+        value = self[code] = chr(self.partition.class_of_code(code))
+        return value
+
+
+class AlphabetPartition:
+    """
+    Partition of all characters into equivalence classes: two characters are in the same class if every
+    transition of the automaton is taken either on both of them or on neither. Simulation tables can then be
+    indexed by the class id instead of the character, which makes them dense and shared by equivalent characters.
+    Class 0 holds the characters that match no label, the other classes are numbered 1..class_count-1.
+    """
+
+    def __init__(self, label_groups: Iterable[Iterable[Symbol]]) -> None:
+        """
+        :param label_groups: groups of transition labels (single characters or character classes), characters
+            are equivalent if they match labels of exactly the same groups. EPSILON is ignored
+        """
+        groups = [[label for label in group if label != EPSILON] for group in label_groups]
+
+        # the labels are unions of these disjoint ranges, characters of a range are equivalent
+        ranges = split_ranges(label for group in groups for label in group)
+        range_starts = [first for first, _ in ranges]
+
+        # the groups every range belongs to
+        signatures: List[List[int]] = [[] for _ in ranges]
+        for group_id, group in enumerate(groups):
+            for label in group:
+                for first, last in label_ranges(label):
+                    index = bisect_right(range_starts, first) - 1
+                    while index < len(ranges) and ranges[index][1] <= last:
+                        signatures[index].append(group_id)
+                        index += 1
+
+        # ranges with the same signature form one class, possibly made up of several ranges
+        class_ids: Dict[Tuple[int, ...], int] = {}
+        class_ranges: List[List[Tuple[int, int]]] = [[]]
+
+        # sorted boundaries of all ranges and gaps between them, the class of the part starting at boundaries[i]
+        self._boundaries: List[int] = [0]
+        self._boundary_classes: List[int] = [NO_MATCH_CLASS]
+
+        for (first, last), signature in zip(ranges, signatures):
+            signature = tuple(sorted(set(signature)))
+            if signature not in class_ids:
+                class_ids[signature] = len(class_ranges)
+                class_ranges.append([])
+            class_id = class_ids[signature]
+            class_ranges[class_id].append((first, last))
+
+            if first == self._boundaries[-1]:
+                self._boundary_classes[-1] = class_id
+            else:
+                self._boundaries.append(first)
+                self._boundary_classes.append(class_id)
+            self._boundaries.append(last + 1)
+            self._boundary_classes.append(NO_MATCH_CLASS)
+
+        self.class_count = len(class_ranges)
+        self._representatives = [None] + [chr(char_ranges[0][0]) for char_ranges in class_ranges[1:]]
+        self._class_ranges = class_ranges
+
+        # direct lookup table for the most common characters
+        self.table = [self.class_of_code(code) for code in range(TABLE_SIZE)]
+
+        self._translation = _TranslationTable(self)
+
+    @classmethod
+    def from_nfa(cls, nfa: NFA) -> 'AlphabetPartition':
+        """
+        Partitions the characters by the transitions of the NFA. Labels of one state with the same destinations
+        form a group, so for example 'a' and 'b' are equivalent in (a|b)* once it is determinized.
+        """
+        groups: Dict[tuple, List[Symbol]] = {}
+        for state, state_transitions in nfa.transitions.items():
+            for symbol, destinations in state_transitions.items():
+                groups.setdefault((state, frozenset(destinations)), []).append(symbol)
+        return cls(groups.values())
+
+    def class_of_code(self, code: int) -> int:
+        return self._boundary_classes[bisect_right(self._boundaries, code) - 1]
+
+    def class_of(self, ch: str) -> int:
+        code = ord(ch)
+        if code < TABLE_SIZE:
+            return self.table[code]
+        return self.class_of_code(code)
+
+    def translate(self, input_string: str) -> Iterable[int]:
+        """
+        Returns the class ids of the characters of the input string, translated at C speed with str.translate.
+        """
+        if len(self._translation) > MAX_TRANSLATED_CHARACTERS:
+            self._translation.clear()
+        translated = input_string.translate(self._translation)
+        if self.class_count <= 256:
+            return translated.encode('latin-1')
+        return memoryview(translated.encode('utf-32-le', 'surrogatepass')).cast('I')
+
+    def representative(self, class_id: int) -> str:
+        """
+        Returns a character of the class, the class behaves exactly like this character.
+        No character represents class 0, since it matches no transition.
+        """
+        if class_id == NO_MATCH_CLASS:
+            raise ValueError("Class of unmatched characters has no representative")
+        return self._representatives[class_id]
+
+    def class_label(self, class_id: int) -> Symbol:
+        """
+        Returns the characters of the class as a transition label.
+        """
+        char_ranges = self._class_ranges[class_id]
+        if len(char_ranges) == 1 and char_ranges[0][0] == char_ranges[0][1]:
+            return chr(char_ranges[0][0])
+        return CharClass(char_ranges)
+
+    def __len__(self) -> int:
+        return self.class_count
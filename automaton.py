@@ -1,9 +1,49 @@
+import operator
+import threading
 from copy import deepcopy
-from typing import Set, Dict
+from typing import NamedTuple, Optional, Set, Dict
+
+from charclass import CharClass, format_label, label_ranges
 
 EPSILON = 'EP'  # since 'symbols' are a single characters, there will be no 'EP' input
 
-state_count = -1  # will become 0 after first next_state_name function call
+ANY_CHAR = CharClass.any_char()
+
+
+class SimulationTables(NamedTuple):
+    """
+    Analyses of an NFA that every simulation needs, computed once by NFA.simulation_tables.
+    """
+    # transitions labeled with character classes, see NFA.class_transitions
+    class_transitions: Dict[int, list[tuple[CharClass, Set[int]]]]
+    # see NFA.co_reachable_states and NFA.accept_absorbing_states
+    live_states: Set[int]
+    absorbing_states: Set[int]
+    # False for reduced NFAs, simulation then has nothing to drop after every step
+    has_dead_states: bool
+
+
+class StateIds:
+    def __init__(self, first: int = 0) -> None:
+        """
+        Allocates the state ids of one compilation, dense and increasing from the first id.
+        Every compilation uses its own allocator, so the ids do not depend on what was compiled before,
+        and compilations running in different threads share nothing. An allocator itself is not thread-safe.
+        """
+        self.next_id = first
+
+    def new(self) -> int:
+        state = self.next_id
+        self.next_id += 1
+        return state
+
+    def new_list(self, size: int) -> list[int]:
+        states = list(range(self.next_id, self.next_id + size))
+        self.next_id += size
+        return states
+
+    def __len__(self) -> int:
+        return self.next_id
 
 
 class NFA:
@@ -13,7 +53,7 @@ class NFA:
         Initializes a new NFA.
 
         :param states: A set of all the states in NFA
-        :param symbols: A set of all input symbols (language)
+        :param symbols: A set of all input symbols (language), single characters or character classes
         :param transitions: A dictionary containing transitions of NFA.
             The keys of the dictionary are the states, and the values are dictionaries
             that match the input symbol with a set of states the symbol transitions to.
@@ -27,14 +67,56 @@ class NFA:
         self.start_state = start_state
         self.accept_states = accept_states
 
-    def alternation(self, other: 'NFA') -> None:
+        # computed on the first simulation, together with the attributes they were computed from
+        self._simulation_tables: Optional[SimulationTables] = None
+        self._tables_source: tuple = ()
+
+    def __getstate__(self) -> dict:
+        # the tables are cheaper to compute again than to store with the automaton
+        state = self.__dict__.copy()
+        state['_simulation_tables'] = None
+        state['_tables_source'] = ()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_simulation_tables', None)
+        self.__dict__.setdefault('_tables_source', ())
+
+    def simulation_tables(self) -> SimulationTables:
+        """
+        Returns the analyses run.simulate needs, so simulating a short input does not cost a pass over
+        the whole automaton. They are computed on the first call and kept until a method of the NFA changes it
+        or one of its attributes is replaced. Code that changes the transitions or accept states in place
+        must call discard_simulation_tables.
+        """
+        source = (self.states, self.transitions, self.accept_states)
+        if self._simulation_tables is None or any(map(operator.is_not, source, self._tables_source)):
+            # both analyses search the reversed transitions, which are built once for them
+            predecessors = self._predecessors()
+            live_states = self._co_reachable_states(predecessors)
+            self._simulation_tables = SimulationTables(self.class_transitions(), live_states,
+                                                       self._accept_absorbing_states(predecessors),
+                                                       not live_states.issuperset(self.states))
+            self._tables_source = source
+        return self._simulation_tables
+
+    def discard_simulation_tables(self) -> None:
+        self._simulation_tables = None
+
+    def alternation(self, other: 'NFA', ids: Optional[StateIds] = None) -> None:
+        """
+        :param ids: allocator of the new states, the states of both NFAs must come from it.
+            The shared allocator of next_state_name is used if None
+        """
         # state names must be unique
         if set(self.states).intersection(other.states):
             raise RuntimeError("Name intersection in NFA alternation")
 
         # create new epsilon states
-        start_epsilon = next_state_name()
-        end_epsilon = next_state_name()
+        start_epsilon, end_epsilon = _new_states(2, ids)
+        self.discard_simulation_tables()
+        other.discard_simulation_tables()
 
         # update states
         self.states.insert(0, start_epsilon)
@@ -67,6 +149,8 @@ class NFA:
 
         # middle point of the concatenation
         middle_state = other.start_state
+        self.discard_simulation_tables()
+        other.discard_simulation_tables()
 
         # make a copy of transitions to modify it while iterating over it
         new_transitions: Dict[int, Dict[str, Set[int]]] = deepcopy(self.transitions)
@@ -88,15 +172,18 @@ class NFA:
         new_transitions.update(other.transitions)
         self.transitions = new_transitions
 
-    def kleene_star(self) -> None:
+    def kleene_star(self, ids: Optional[StateIds] = None) -> None:
+        """
+        :param ids: allocator the states of the NFA come from, see alternation
+        """
         # create new epsilon states and save the old ones
-        start_epsilon = next_state_name()
-        end_epsilon = next_state_name()
+        start_epsilon, end_epsilon = _new_states(2, ids)
         old_start_state = self.states[0]
         old_final_state = self.states[-1]
 
         # update start state
         self.start_state = start_epsilon
+        self.discard_simulation_tables()
 
         # update accept state
         assert self.accept_states.pop() == old_final_state
@@ -111,110 +198,193 @@ class NFA:
         self.transitions[old_final_state] = {EPSILON: {old_start_state, end_epsilon}}
 
     def reduce(self) -> None:
-        self._remove_unreachable_states()
-        self._rename_removed_states()
+        """
+        Removes the states that are unreachable from the start state or can not reach an accept state
+        and renames the remaining ones to 0..n-1, keeping their order. The start state is always kept,
+        even if the language is empty.
+        """
+        live_states = self._reachable_states() & self.co_reachable_states()
+        live_states.add(self.start_state)
+        live_states = [state for state in self.states if state in live_states]
+        self._rewrite_states({state: i for i, state in enumerate(live_states)})
 
     def remove_epsilon(self) -> None:
-        # first, all states that transition into accept state with epsilon, become accepting themselves
-        while True:
-            accept_count = len(self.accept_states)
+        closures = self._epsilon_closures()
+        self.discard_simulation_tables()
+
+        new_transitions: Dict[int, Dict[str, Set[int]]] = {}
+        for state in self.transitions:
+            if state not in closures:
+                # no epsilon transitions, the state keeps its own transitions
+                new_transitions[state] = {symbol: set(destinations)
+                                          for symbol, destinations in self.transitions[state].items()}
+                continue
 
-            # iterate over epsilon transitions
-            for state in self.transitions:
-                if EPSILON not in self.transitions[state]:
+            closure = closures[state]
+
+            # a state becomes accepting if any state in its epsilon closure is accepting
+            if not closure.isdisjoint(self.accept_states):
+                self.accept_states.add(state)
+
+            # the state gets non-epsilon transitions of every state in its epsilon closure
+            state_transitions: Dict[str, Set[int]] = {}
+            for closure_state in closure:
+                if closure_state not in self.transitions:
                     continue
+                for symbol, destinations in self.transitions[closure_state].items():
+                    if symbol == EPSILON:
+                        continue
+                    if symbol not in state_transitions:
+                        state_transitions[symbol] = set()
+                    state_transitions[symbol].update(destinations)
 
-                # if the state transitions to accepting state with epsilon symbol, the current state becomes accepting
-                if self.transitions[state][EPSILON].intersection(self.accept_states):
-                    self.accept_states.add(state)
+            if state_transitions:
+                new_transitions[state] = state_transitions
 
-            # if no new accept states were added in the iteration, break
-            if len(self.accept_states) == accept_count:
-                break
+        self.transitions = new_transitions
 
-        # iterate over transitions while there is at least one epsilon transition
-        while self._transitions_contain_epsilon():
+    def class_transitions(self) -> Dict[int, list[tuple[CharClass, Set[int]]]]:
+        """
+        Returns transitions labeled with character classes, {state: [(class, {states}), ...], ...}.
+        Simulation looks single characters up directly in transitions and checks these separately.
+        """
+        result: Dict[int, list[tuple[CharClass, Set[int]]]] = {}
+        for state in self.transitions:
+            for symbol, destinations in self.transitions[state].items():
+                if isinstance(symbol, CharClass):
+                    if state not in result:
+                        result[state] = []
+                    result[state].append((symbol, destinations))
+        return result
+
+    def co_reachable_states(self) -> Set[int]:
+        """
+        Returns the states an accept state can be reached from. Once a simulation has no such state active,
+        no longer prefix of the input can be accepted.
+        """
+        return self._co_reachable_states(self._predecessors())
 
-            # create a copy of the transitions to change it while iterating over it
-            temp: Dict[int, Dict[str, Set[int]]] = deepcopy(self.transitions)
+    def _co_reachable_states(self, predecessors: Dict[int, Set[int]]) -> Set[int]:
+        # search backwards from the accept states
+        visited = set(self.accept_states)
+        stack = list(self.accept_states)
+        while stack:
+            for source in predecessors.get(stack.pop(), ()):
+                if source not in visited:
+                    visited.add(source)
+                    stack.append(source)
+        return visited
 
-            # loop over states that have epsilon transitions
-            for state in self.transitions:
-                if EPSILON not in self.transitions[state]:
-                    continue
+    def accept_absorbing_states(self) -> Set[int]:
+        """
+        Returns accept states from which every input is accepted: all of them are accepting, and every character
+        leads from each of them to another one. Once a simulation has one of them active, every longer prefix
+        of the input is accepted. For example the state of .* in ab.* is accept-absorbing.
+        """
+        return self._accept_absorbing_states(self._predecessors())
 
-                # set up a stack to keep track of visited states and visit them
-                visited = set()
-                stack = [state]
+    def _accept_absorbing_states(self, predecessors: Dict[int, Set[int]]) -> Set[int]:
+        # greatest such set of accept states, states without a transition into the set on some character
+        # are removed until the rest is consistent
+        absorbing = set(self.accept_states)
+        stack = list(absorbing)
+        while stack:
+            state = stack.pop()
+            if state not in absorbing:
+                continue
+            ranges = [char_range for label, destinations in self.transitions.get(state, {}).items()
+                      if label != EPSILON and not destinations.isdisjoint(absorbing)
+                      for char_range in label_ranges(label)]
+            if CharClass(ranges) != ANY_CHAR:
+                absorbing.remove(state)
+                stack.extend(predecessors.get(state, ()))
+        return absorbing
+
+    def _epsilon_successors(self, state: int) -> Set[int]:
+        if state in self.transitions and EPSILON in self.transitions[state]:
+            return self.transitions[state][EPSILON]
+        return set()
+
+    def _is_closure_target(self, state: int) -> bool:
+        if state in self.accept_states:
+            return True
+        state_transitions = self.transitions.get(state)
+        return state_transitions is not None and (len(state_transitions) > 1 or EPSILON not in state_transitions)
+
+    def _epsilon_closures(self) -> Dict[int, Set[int]]:
+        """
+        Computes epsilon closures of all states that are reachable with epsilon transitions from
+        a state that has an epsilon transition. Uses iterative Tarjan's algorithm, strongly connected
+        components of the epsilon graph are found in reverse topological order, so the closure of a
+        component is its states together with the already computed closures of its successors.
+        States in the same component share the same closure set.
+        """
+        closures: Dict[int, Set[int]] = {}
+        index: Dict[int, int] = {}
+        low_link: Dict[int, int] = {}
+        component_stack: list[int] = []
+        on_stack: Set[int] = set()
+
+        for root in self.transitions:
+            if root in index or EPSILON not in self.transitions[root]:
+                continue
 
-                while stack:
-                    curr_state = stack.pop()
-                    if curr_state in visited:
-                        continue
-                    visited.add(curr_state)
+            index[root] = low_link[root] = len(index)
+            component_stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self._epsilon_successors(root)))]
+
+            while work:
+                state, successors = work[-1]
+
+                # visit the next unvisited successor, if there is one
+                descended = False
+                for successor in successors:
+                    if successor not in index:
+                        index[successor] = low_link[successor] = len(index)
+                        component_stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self._epsilon_successors(successor))))
+                        descended = True
+                        break
+                    if successor in on_stack:
+                        low_link[state] = min(low_link[state], index[successor])
+                if descended:
+                    continue
 
-                    # if current state does not have any transitions, move on to next state
-                    if curr_state not in self.transitions:
-                        continue
+                # all successors are done
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[state])
 
-                    # iterate over all symbols and their transitions from the current state
-                    for symbol in self.transitions[curr_state]:
-                        if symbol == EPSILON:
-                            # for epsilon transitions, add all transition states to the stack
-                            for transition_state in self.transitions[curr_state][EPSILON]:
-                                stack.append(transition_state)
-
-                                # if the current state has an epsilon transition to a transition state, remove it
-                                if curr_state in temp and EPSILON in temp[curr_state]:
-                                    temp[curr_state][EPSILON].remove(transition_state)
-
-                            # delete the epsilon transition from the current state
-                            if curr_state in temp and EPSILON in temp[curr_state]:
-                                del temp[curr_state][EPSILON]
-
-                            # if the current state does not have any transitions left, delete it from temp
-                            if curr_state in temp and not temp[curr_state]:
-                                del temp[curr_state]
-                        else:
-                            # for non-epsilon transitions, add the transition states to the temp dictionary
-                            if state not in temp:
-                                temp[state] = dict()
-                            if symbol not in temp[state]:
-                                temp[state][symbol] = set()
-                            for transition_state in self.transitions[curr_state][symbol]:
-                                temp[state][symbol].add(transition_state)
-
-            # update the transitions with the changes made in the temp dictionary
-            self.transitions = temp
-
-    def _transitions_contain_epsilon(self) -> bool:
-        for state in self.transitions:
-            if EPSILON in self.transitions[state]:
-                return True
-        return False
+                if low_link[state] != index[state]:
+                    continue
 
-    def _remove_unreachable_states(self) -> None:
-        unreachable_states = set(self.states) - self._reachable_states()
+                # the state is the root of a component, pop the component from the stack
+                component = []
+                while True:
+                    member = component_stack.pop()
+                    on_stack.remove(member)
+                    component.append(member)
+                    if member == state:
+                        break
 
-        # remove the bad state from the list of states
-        for i in range(len(self.states) - 1, -1, -1):
-            if self.states[i] in unreachable_states:
-                del self.states[i]
+                members = set(component)
+                closure = {member for member in component if self._is_closure_target(member)}
+                for member in component:
+                    for successor in self._epsilon_successors(member):
+                        if successor not in members:
+                            closure.update(closures[successor])
 
-        # remove the bad state from the set of accept states
-        for bad_state in unreachable_states:
-            if bad_state in self.accept_states:
-                self.accept_states.remove(bad_state)
+                for member in component:
+                    closures[member] = closure
 
-        # remove the bad state from the keys of the transitions
-        for state in unreachable_states:
-            if state in self.transitions:
-                del self.transitions[state]
+        return closures
 
-        # remove the bad state from the values of the transitions
-        for state in self.transitions:
-            for symbol in self.transitions[state]:
-                self.transitions[state][symbol] = self.transitions[state][symbol].difference(unreachable_states)
+    def _remove_unreachable_states(self) -> None:
+        reachable_states = self._reachable_states()
+        self._rewrite_states({state: state for state in self.states if state in reachable_states})
 
     def _reachable_states(self) -> Set[int]:
         # Perform a depth-first search from the start state to find all reachable states
@@ -232,32 +402,37 @@ class NFA:
                     stack.append(dest_state)
         return visited
 
-    def _rename_removed_states(self) -> None:
-        for i in range(len(self.states)):
-            if self.states[i] == i:
-                continue
-
-            old_index = self.states[i]
-
-            # rename in states list
-            self.states[i] = i
+    def _predecessors(self) -> Dict[int, Set[int]]:
+        # reversed transitions without their labels
+        predecessors: Dict[int, Set[int]] = {}
+        for state, state_transitions in self.transitions.items():
+            for destinations in state_transitions.values():
+                for destination in destinations:
+                    predecessors.setdefault(destination, set()).add(state)
+        return predecessors
 
-            # rename in accept states
-            if old_index in self.accept_states:
-                self.accept_states.remove(old_index)
-                self.accept_states.add(i)
-
-            # rename in transition keys
-            if old_index in self.transitions:
-                value = self.transitions.pop(old_index)
-                self.transitions[i] = value
+    def _rewrite_states(self, new_names: Dict[int, int]) -> None:
+        """
+        Renames the states by the mapping in a single pass over the automaton.
+        States missing from the mapping are removed together with every transition to or from them,
+        symbols left without destinations are dropped.
+        """
+        self.states = [new_names[state] for state in self.states if state in new_names]
+        self.start_state = new_names.get(self.start_state, self.start_state)
+        self.accept_states = {new_names[state] for state in self.accept_states if state in new_names}
 
-            # rename in transition values
-            for state in self.transitions:
-                for symbol in self.transitions[state]:
-                    if old_index in self.transitions[state][symbol]:
-                        self.transitions[state][symbol].remove(old_index)
-                        self.transitions[state][symbol].add(i)
+        transitions: Dict[int, Dict[str, Set[int]]] = {}
+        for state, state_transitions in self.transitions.items():
+            if state not in new_names:
+                continue
+            new_state_transitions: Dict[str, Set[int]] = {}
+            for symbol, destinations in state_transitions.items():
+                new_destinations = {new_names[destination] for destination in destinations if destination in new_names}
+                if new_destinations:
+                    new_state_transitions[symbol] = new_destinations
+            if new_state_transitions:
+                transitions[new_names[state]] = new_state_transitions
+        self.transitions = transitions
 
     def _transitions_count(self, state: int) -> int:
         res: int = 0
@@ -272,31 +447,219 @@ class NFA:
         return res
 
     def __str__(self) -> str:
-        res: str = f"{len(self.states)} {len(self.accept_states)} {self._total_transitions_count()}\n"
-
-        for accept_state in self.accept_states:
-            res += f"{accept_state} "
-
-        res = res[:-1] + '\n'
+        # collect the lines and join them once, repeated string concatenation is slow for large NFAs
+        lines: list[str] = [f"{len(self.states)} {len(self.accept_states)} {self._total_transitions_count()}",
+                            ' '.join(str(accept_state) for accept_state in self.accept_states)]
 
         for state in self.states:
             if state not in self.transitions.keys():
-                res += '0'
+                lines.append('0')
             else:
-                res += str(self._transitions_count(state)) + ' '
+                line = [str(self._transitions_count(state)) + ' ']
                 for symbol in self.transitions[state]:
+                    label = format_label(symbol)
                     for destination in self.transitions[state][symbol]:
-                        res += f"{symbol} {destination} "
-            res += '\n'
+                        line.append(f"{label} {destination} ")
+                lines.append(''.join(line))
 
-        return res
+        return '\n'.join(lines) + '\n'
+
+
+class Fragment(NamedTuple):
+    """
+    Part of an NFA under construction in ThompsonBuilder, identified by its start and accept states.
+    The accept state has no outgoing transitions until the fragment is linked to another one.
+    """
+    start: int
+    accept: int
+
+
+class FragmentTemplate(NamedTuple):
+    """
+    Epsilon-free copy of a fragment with states 0..size-1 and start state 0, which ThompsonBuilder.instantiate
+    turns into new fragments by offsetting the ids. final_states are the states the fragment accepts in.
+    """
+    size: int
+    transitions: Dict[int, Dict[str, Set[int]]]
+    final_states: frozenset
+
+
+class ThompsonBuilder:
+    def __init__(self, ids: Optional[StateIds] = None) -> None:
+        """
+        Builds an epsilon-NFA with Thompson's construction in a single shared transition table.
+        Fragments are linked with epsilon transitions, so every operation takes constant time
+        and the accumulated table is never copied.
+
+        :param ids: allocator of the state ids, by default a new one, so the ids are 0..n-1 and builders
+            in different threads are independent
+        """
+        self.ids = StateIds() if ids is None else ids
+        self.states: list[int] = []
+        self.symbols: Set[str] = set()
+        self.transitions: Dict[int, Dict[str, Set[int]]] = {}
+
+    def symbol(self, symbol: str) -> Fragment:
+        start, accept = self._new_state(), self._new_state()
+        self._add_transition(start, symbol, accept)
+        self.symbols.add(symbol)
+        return Fragment(start, accept)
+
+    def concatenation(self, first: Fragment, second: Fragment) -> Fragment:
+        self._add_transition(first.accept, EPSILON, second.start)
+        return Fragment(first.start, second.accept)
+
+    def alternation(self, first: Fragment, second: Fragment) -> Fragment:
+        start, accept = self._new_state(), self._new_state()
+        self._add_transition(start, EPSILON, first.start)
+        self._add_transition(start, EPSILON, second.start)
+        self._add_transition(first.accept, EPSILON, accept)
+        self._add_transition(second.accept, EPSILON, accept)
+        return Fragment(start, accept)
+
+    def kleene_star(self, fragment: Fragment) -> Fragment:
+        start, accept = self._new_state(), self._new_state()
+        self._add_transition(start, EPSILON, fragment.start)
+        self._add_transition(start, EPSILON, accept)
+        self._add_transition(fragment.accept, EPSILON, fragment.start)
+        self._add_transition(fragment.accept, EPSILON, accept)
+        return Fragment(start, accept)
+
+    def plus(self, fragment: Fragment) -> Fragment:
+        start, accept = self._new_state(), self._new_state()
+        self._add_transition(start, EPSILON, fragment.start)
+        self._add_transition(fragment.accept, EPSILON, fragment.start)
+        self._add_transition(fragment.accept, EPSILON, accept)
+        return Fragment(start, accept)
+
+    def optional(self, fragment: Fragment) -> Fragment:
+        start, accept = self._new_state(), self._new_state()
+        self._add_transition(start, EPSILON, fragment.start)
+        self._add_transition(start, EPSILON, accept)
+        self._add_transition(fragment.accept, EPSILON, accept)
+        return Fragment(start, accept)
+
+    def copy(self, fragment: Fragment, begin: int, end: int) -> Fragment:
+        """
+        Creates a copy of the fragment with new states.
+        :param fragment: fragment to copy, its accept state must not be linked to anything yet
+        :param begin: index in self.states of the first state of the fragment
+        :param end: index in self.states after the last state of the fragment
+        """
+        renamed: Dict[int, int] = {state: self._new_state() for state in self.states[begin:end]}
+        for state, new_state in renamed.items():
+            if state not in self.transitions:
+                continue
+            self.transitions[new_state] = {symbol: {renamed[destination] for destination in destinations}
+                                           for symbol, destinations in self.transitions[state].items()}
+        return Fragment(renamed[fragment.start], renamed[fragment.accept])
+
+    def repeat(self, fragment: Fragment, begin: int, end: int, minimum: int, maximum: Optional[int]) -> Fragment:
+        """
+        Bounded repetition fragment{minimum,maximum}, unbounded if maximum is None.
+        Optional copies are nested, x{0,3} is built as (x(x(x)?)?)?, so every skip goes to the same exit
+        and removing epsilon transitions adds a constant number of transitions per copy.
+        :param fragment: fragment to repeat, its states are self.states[begin:end]
+        """
+        if maximum == 0:
+            return self.symbol(EPSILON)
+
+        # all copies are made before anything is linked to the accept state of the original
+        count = max(minimum, 1) if maximum is None else maximum
+        copies = [fragment] + [self.copy(fragment, begin, end) for _ in range(count - 1)]
+
+        required = copies[:minimum]
+        if maximum is None:
+            # x{m,} is x{m-1} followed by x+, or x* if m is 0
+            last = copies[-1]
+            if minimum == 0:
+                required.append(self.kleene_star(last))
+            else:
+                required[-1] = self.plus(last)
+        else:
+            tail: Optional[Fragment] = None
+            for optional_copy in reversed(copies[minimum:]):
+                tail = self.optional(optional_copy if tail is None else self.concatenation(optional_copy, tail))
+            if tail is not None:
+                required.append(tail)
+
+        result = required[0]
+        for part in required[1:]:
+            result = self.concatenation(result, part)
+        return result
+
+    def template(self, fragment: Fragment, begin: int) -> FragmentTemplate:
+        """
+        Creates a template of the fragment for instantiate, its epsilon transitions are removed and its
+        unreachable and dead states dropped, so every instance is smaller than a fresh Thompson fragment.
+        :param fragment: fragment, its accept state must not be linked to anything yet
+        :param begin: index in self.states of the first state of the fragment
+        """
+        states = [fragment.start] + [state for state in self.states[begin:] if state != fragment.start]
+        relative: Dict[int, int] = {state: i for i, state in enumerate(states)}
+        transitions = {relative[state]: {symbol: {relative[destination] for destination in destinations}
+                                         for symbol, destinations in self.transitions[state].items()}
+                       for state in states if state in self.transitions}
+
+        nfa = NFA(list(range(len(states))), self.symbols, transitions, 0, {relative[fragment.accept]})
+        nfa.remove_epsilon()
+        nfa.reduce()
+        return FragmentTemplate(len(nfa.states), nfa.transitions, frozenset(nfa.accept_states))
+
+    def instantiate(self, template: FragmentTemplate) -> Fragment:
+        """
+        Creates a fragment from the template with new states, the ids of the template are offset by the first
+        new id. A new accept state is linked from the final states of the template with epsilon transitions.
+        """
+        first = self.ids.next_id
+        states = self.ids.new_list(template.size)
+        self.states.extend(states)
+        for state, state_transitions in template.transitions.items():
+            self.transitions[first + state] = {symbol: {first + destination for destination in destinations}
+                                               for symbol, destinations in state_transitions.items()}
+
+        accept = self._new_state()
+        for state in template.final_states:
+            self._add_transition(first + state, EPSILON, accept)
+        return Fragment(first, accept)
+
+    def to_nfa(self, fragment: Fragment) -> NFA:
+        """
+        Creates an NFA from the fragment. The start state is put first in the list of states,
+        the same as in NFAs created with NFA operations.
+        """
+        states = [fragment.start] + [state for state in self.states if state != fragment.start]
+        return NFA(states, self.symbols, self.transitions, fragment.start, {fragment.accept})
+
+    def _new_state(self) -> int:
+        state = self.ids.new()
+        self.states.append(state)
+        return state
+
+    def _add_transition(self, source: int, symbol: str, destination: int) -> None:
+        state_transitions = self.transitions.get(source)
+        if state_transitions is None:
+            self.transitions[source] = {symbol: {destination}}
+        elif symbol not in state_transitions:
+            state_transitions[symbol] = {destination}
+        else:
+            state_transitions[symbol].add(destination)
+
+
+# allocator of NFAs built by hand from get_states_list and NFA operations, shared by all threads
+_shared_ids = StateIds()
+_shared_ids_lock = threading.Lock()
 
 
 def next_state_name() -> int:
-    global state_count
-    state_count += 1
-    return state_count
+    with _shared_ids_lock:
+        return _shared_ids.new()
 
 
 def get_states_list(size: int) -> list[int]:
-    return [next_state_name() for _ in range(size)]
+    with _shared_ids_lock:
+        return _shared_ids.new_list(size)
+
+
+def _new_states(size: int, ids: Optional[StateIds]) -> list[int]:
+    return get_states_list(size) if ids is None else ids.new_list(size)
@@ -0,0 +1,162 @@
+import argparse
+import sys
+from itertools import islice
+from typing import Iterable, Iterator, Optional, TextIO
+
+import build
+from cache import AutomatonCache
+from automaton import NFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+from metrics import DISABLED, Metrics, hit_rate
+from parallel import DEFAULT_CHUNK_BYTES, DEFAULT_CHUNK_SIZE, match_file_parallel, match_parallel
+
+
+def match_many(nfa: NFA, inputs: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE,
+               metrics: Optional[Metrics] = None) -> Iterator[str]:
+    """
+    Simulates every input string on the same automaton and yields the 'Y'/'N' result for each of them.
+    All inputs share one lazily built DFA, so transitions computed for one string are reused for the next.
+    :param nfa: epsilon-free NFA
+    :param inputs: iterable of input strings, consumed lazily
+    :param cache_size: maximum number of cached DFA states
+    :param metrics: receives the statistics of the lazy DFA once all inputs are matched
+    :return: generator of results, in the order of inputs
+    """
+    lazy_dfa = LazyDFA(nfa, cache_size)
+    for input_string in inputs:
+        yield lazy_dfa.simulate(input_string)
+    if metrics is not None:
+        metrics.update('lazy_dfa', lazy_dfa.stats())
+
+
+def match_regex(regex: str, inputs: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE) -> Iterator[str]:
+    """
+    Compiles the regular expression once and matches all inputs against it, see match_many.
+    """
+    return match_many(build.compile_regex(regex), inputs, cache_size)
+
+
+def match_lines(nfa: NFA, lines: TextIO, output: TextIO, flush: bool = True,
+                cache_size: int = DEFAULT_CACHE_SIZE, metrics: Optional[Metrics] = None) -> None:
+    """
+    Matches every line of the input stream (without the line break) and writes one result line per input line.
+    :param nfa: epsilon-free NFA
+    :param lines: text stream with one input string per line
+    :param output: text stream results are written to
+    :param flush: flush the output after every line, so results can be consumed while the input is read
+    :param cache_size: maximum number of cached DFA states
+    :param metrics: receives the statistics of the lazy DFA
+    """
+    inputs = (line.rstrip('\n') for line in lines)
+    for result in match_many(nfa, inputs, cache_size, metrics):
+        output.write(result + '\n')
+        if flush:
+            output.flush()
+
+
+def match_lines_vectorized(nfa: NFA, lines: TextIO, output: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           cache_size: int = DEFAULT_CACHE_SIZE, metrics: Optional[Metrics] = None) -> None:
+    """
+    Same as match_lines, but reads chunk_size lines at a time and matches them together with vectorized.DenseDFA.
+    Falls back to the lazy DFA if NumPy is not installed or the DFA is too large.
+    :param metrics: receives the number of states of the dense DFA, or the statistics of the lazy DFA
+    """
+    # imported here, so NumPy is only loaded when it is used
+    from vectorized import compile_dense
+
+    dense_dfa = compile_dense(nfa)
+    if dense_dfa is None:
+        match_lines(nfa, lines, output, False, cache_size, metrics)
+        return
+    if metrics is not None:
+        metrics.set('dense_dfa.states', len(dense_dfa.accepting))
+
+    inputs = (line.rstrip('\n') for line in lines)
+    while True:
+        chunk = list(islice(inputs, chunk_size))
+        if not chunk:
+            break
+        output.write(''.join(result + '\n' for result in dense_dfa.match(chunk)))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compiles a regular expression once and simulates every line "
+                                                 "of the input on it, printing one result line per input line")
+    parser.add_argument('regex', help="regular expression")
+    parser.add_argument('input', nargs='?', help="file with one input string per line, stdin if omitted")
+    parser.add_argument('--dfa', action='store_true', help="compile the regex to a minimal DFA first")
+    parser.add_argument('--cache-dir', help="directory with compiled automata shared between runs")
+    parser.add_argument('--no-flush', action='store_true', help="do not flush the output after every line")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached DFA states")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="number of worker processes, inputs are matched in the current process if 0")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="number of input lines sent to a worker at once when reading from stdin")
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES,
+                        help="approximate number of bytes of the input file handled by a worker at once")
+    parser.add_argument('--vectorized', action='store_true',
+                        help="match chunks of --chunk-size lines at once with NumPy, if it is installed")
+    parser.add_argument('--stats', action='store_true',
+                        help="print the time spent compiling and matching, and cache statistics to stderr")
+    args = parser.parse_args()
+
+    # combinations that would silently drop one of the options
+    if args.dfa and args.cache_dir is not None:
+        parser.error("--dfa can not be used with --cache-dir, the cache only holds NFAs")
+    if args.workers and args.vectorized:
+        parser.error("--vectorized can not be used with --workers")
+    if args.workers and args.stats:
+        parser.error("--stats can not be used with --workers, the worker processes do not report statistics")
+    return args
+
+
+def main():
+    args = parse_args()
+    metrics = Metrics() if args.stats else None
+
+    automaton_cache = None
+    with (metrics or DISABLED).phase('compile'):
+        if args.dfa:
+            nfa: NFA = build.regex_to_dfa(args.regex, metrics=metrics)
+        elif args.cache_dir is not None:
+            automaton_cache = AutomatonCache(directory=args.cache_dir)
+            nfa: NFA = automaton_cache.get(args.regex)
+        else:
+            nfa: NFA = build.compile_regex(args.regex, metrics)
+
+    with (metrics or DISABLED).phase('match'):
+        if args.workers and args.input is None:
+            inputs = (line.rstrip('\n') for line in sys.stdin)
+            results = match_parallel(nfa, inputs, args.workers, args.chunk_size, args.cache_size)
+            for count, result in enumerate(results, 1):
+                sys.stdout.write(result + '\n')
+                # the results of a chunk arrive together, flush once they are all written
+                if not args.no_flush and count % args.chunk_size == 0:
+                    sys.stdout.flush()
+        elif args.workers:
+            for results in match_file_parallel(nfa, args.input, args.workers, args.chunk_bytes, args.cache_size):
+                sys.stdout.write(results)
+                if not args.no_flush:
+                    sys.stdout.flush()
+        elif args.vectorized:
+            input_file = sys.stdin if args.input is None else open(args.input, 'r')
+            with input_file:
+                match_lines_vectorized(nfa, input_file, sys.stdout, args.chunk_size, args.cache_size, metrics)
+        elif args.input is None:
+            match_lines(nfa, sys.stdin, sys.stdout, not args.no_flush, args.cache_size, metrics)
+        else:
+            with open(args.input, 'r') as input_file:
+                match_lines(nfa, input_file, sys.stdout, not args.no_flush, args.cache_size, metrics)
+
+    if metrics is not None:
+        if automaton_cache is not None:
+            cache_stats = automaton_cache.stats()
+            metrics.update('cache', cache_stats)
+            metrics.set('cache.hit_rate', hit_rate(cache_stats['hits'], cache_stats['misses']))
+        sys.stdout.flush()
+        print(metrics.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
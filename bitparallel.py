@@ -0,0 +1,137 @@
+from typing import Dict, List, Tuple
+
+from automaton import NFA
+from charclass import Symbol, label_matches
+
+CHUNK_BITS = 32  # active states are looked up in chunks of this many states
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_CACHED_CHUNKS = 65536  # successor masks of chunks kept before the cache is cleared
+MAX_CACHED_CHARACTERS = 4096  # characters whose matching labels are kept before the cache is cleared
+
+
+class BitParallelNFA:
+    def __init__(self, nfa: NFA) -> None:
+        """
+        Initializes a bit-parallel simulator of an epsilon-free NFA.
+        The set of active states is a single integer, bit i is set if nfa.states[i] is active.
+
+        If every state is entered only with a single symbol (which holds for NFAs built by build.py,
+        after removing epsilon transitions), the automaton is homogeneous and one step is
+        next = follow(active) & symbol_mask[ch], where follow does not depend on the symbol (Glushkov style)
+        and symbol_mask[ch] is the union of the masks of all symbols (characters or classes) matching ch.
+        Otherwise successors are looked up per matching symbol.
+        Successor masks of whole chunks of states are computed on demand and cached.
+        """
+        self.nfa = nfa
+        state_ids: Dict[int, int] = {state: i for i, state in enumerate(nfa.states)}
+
+        self.start_mask = 1 << state_ids[nfa.start_state]
+        self.accept_mask = 0
+        for state in nfa.accept_states:
+            if state in state_ids:
+                self.accept_mask |= 1 << state_ids[state]
+
+        # successor masks of single states: for every state {symbol: mask} and the union over all symbols
+        self._successors: List[Dict[Symbol, int]] = [{} for _ in nfa.states]
+        self._follow: List[int] = [0] * len(nfa.states)
+
+        # symbol -> mask of states that are entered with it, symbols are single characters or character classes
+        self.symbol_masks: Dict[Symbol, int] = {}
+
+        for state, state_transitions in nfa.transitions.items():
+            source = state_ids[state]
+            for symbol, destinations in state_transitions.items():
+                mask = 0
+                for destination in destinations:
+                    mask |= 1 << state_ids[destination]
+                self._successors[source][symbol] = mask
+                self._follow[source] |= mask
+                self.symbol_masks[symbol] = self.symbol_masks.get(symbol, 0) | mask
+
+        # homogeneous if no state is entered with two different symbols
+        seen = 0
+        self.homogeneous = True
+        for mask in self.symbol_masks.values():
+            if seen & mask:
+                self.homogeneous = False
+                break
+            seen |= mask
+
+        # (symbol, chunk shift, chunk value) -> successor mask, symbol is None for follow masks
+        self._chunk_cache: Dict[Tuple, int] = {}
+
+        # character -> (symbols matching it, union of their masks)
+        self._character_cache: Dict[str, Tuple[tuple, int]] = {}
+
+    def step(self, active: int, ch: str) -> int:
+        """
+        Returns the mask of states reachable from the active states by consuming the character.
+        """
+        matching = self._character_cache.get(ch)
+        if matching is None:
+            matching = self._matching_symbols(ch)
+        symbols, symbol_mask = matching
+        if not symbol_mask:
+            return 0
+
+        # a homogeneous automaton needs only the follow masks, otherwise every matching symbol is looked up
+        table_symbols = (None,) if self.homogeneous else symbols
+        cache = self._chunk_cache
+        next_mask = 0
+
+        # visit only the chunks that contain at least one active state
+        remaining = active
+        while remaining:
+            shift = ((remaining & -remaining).bit_length() - 1) // CHUNK_BITS * CHUNK_BITS
+            chunk = (remaining >> shift) & CHUNK_MASK
+            remaining ^= chunk << shift
+
+            for table_symbol in table_symbols:
+                key = (table_symbol, shift, chunk)
+                successors = cache.get(key)
+                if successors is None:
+                    if len(cache) >= MAX_CACHED_CHUNKS:
+                        cache.clear()
+                    successors = cache[key] = self._chunk_successors(table_symbol, shift, chunk)
+                next_mask |= successors
+
+        if self.homogeneous:
+            next_mask &= symbol_mask
+        return next_mask
+
+    def simulate(self, input_string: str) -> str:
+        """
+        Simulates the input string and returns 'Y'/'N' for each prefix, same as run.simulate.
+        """
+        result: List[str] = []
+        accept_mask = self.accept_mask
+
+        active = self.start_mask
+        for ch in input_string:
+            active = self.step(active, ch) if active else 0
+            result.append('Y' if active & accept_mask else 'N')
+
+        return ''.join(result)
+
+    def _matching_symbols(self, ch: str) -> Tuple[tuple, int]:
+        symbols = tuple(symbol for symbol in self.symbol_masks if label_matches(symbol, ch))
+        symbol_mask = 0
+        for symbol in symbols:
+            symbol_mask |= self.symbol_masks[symbol]
+
+        if len(self._character_cache) >= MAX_CACHED_CHARACTERS:
+            self._character_cache.clear()
+        self._character_cache[ch] = (symbols, symbol_mask)
+        return symbols, symbol_mask
+
+    def _chunk_successors(self, symbol, shift: int, chunk: int) -> int:
+        mask = 0
+        while chunk:
+            lowest_bit = chunk & -chunk
+            chunk ^= lowest_bit
+            state = shift + lowest_bit.bit_length() - 1
+            if symbol is None:
+                mask |= self._follow[state]
+            else:
+                mask |= self._successors[state].get(symbol, 0)
+        return mask
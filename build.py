@@ -1,100 +1,538 @@
-from automaton import NFA, EPSILON, get_states_list
+import argparse
+import string
+import sys
+from collections import Counter
+from typing import Dict, NamedTuple, Optional, Set, Tuple, Union
 
+from automaton import NFA, EPSILON, Fragment, FragmentTemplate, ThompsonBuilder
+from charclass import MAX_CODE_POINT, CharClass, Symbol
+import serialization
+from dfa import DFAStateLimitError, DEFAULT_MAX_DFA_STATES, determinize, minimize
+from metrics import DISABLED, Metrics
 
-def format_epsilon(regex: list) -> list:
+
+# operators in postfix token streams, symbols are single characters or character classes
+CONCATENATION = 0
+ALTERNATION = 1
+KLEENE_STAR = 2
+PLUS = 3
+OPTIONAL = 4
+
+OPEN_PARENTHESIS = '('
+PRECEDENCE = {ALTERNATION: 1, CONCATENATION: 2}
+UNARY_OPERATORS = {'*': KLEENE_STAR, '+': PLUS, '?': OPTIONAL}
+
+MAX_REPEAT = 1000  # largest count allowed in bounded repetition {m,n}
+MAX_REPEAT_STATES = 100000  # largest number of states all copies made by bounded repetition may add to an automaton
+MIN_SHARED_TOKENS = 8  # repeated subexpressions with fewer postfix tokens are built again instead of copied
+MIN_SHARED_OCCURRENCES = 3  # a template costs about as much as building the subexpression once more
+
+# classes for escapes \d, \w and \s, their uppercase versions are the negated classes
+ESCAPE_CLASSES = {
+    'd': CharClass([(ord('0'), ord('9'))]),
+    'w': CharClass([(ord('0'), ord('9')), (ord('A'), ord('Z')), (ord('a'), ord('z')), (ord('_'), ord('_'))]),
+    's': CharClass.from_chars(' \t\n\r\f\v'),
+}
+ESCAPE_CHARACTERS = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v'}
+HEX_ESCAPE_DIGITS = {'x': 2, 'u': 4, 'U': 8}
+
+
+class Repeat(NamedTuple):
+    """
+    Bounded repetition operator {minimum,maximum} in postfix token streams, maximum is None for {minimum,}.
+    position is the index of the '{' in the regex, for errors found while the automaton is built.
+    """
+    minimum: int
+    maximum: Optional[int]
+    position: int
+
+
+class RegexSyntaxError(ValueError):
+    def __init__(self, message: str, position: int) -> None:
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+def to_postfix(regex: str) -> list:
+    """
+    Converts regular expression into postfix token stream with the shunting-yard algorithm.
+    Concatenation is implicit in the regex and explicit in the postfix stream.
+    Works in a single pass with an explicit stack, so neither the length nor the nesting depth is limited.
+    Besides '|', '*' and parentheses the syntax has '+', '?', bounded repetition {m}, {m,} and {m,n},
+    character classes like [a-z], [^0-9], the wildcard '.' and escape sequences, see parse_escape.
+    Example: '(ab|c)*' -> ['a', 'b', CONCATENATION, 'c', ALTERNATION, KLEENE_STAR]
+    :param regex: regular expression
+    :return: list of symbols (single characters, character classes, EPSILON for empty parentheses) and operators
+    """
+    output: list = []
+
+    # stack of (operator or OPEN_PARENTHESIS, position in the regex)
+    operators: list[tuple] = []
+
+    # true if the next token has to start an operand, at the start, after '(' and after '|'
+    expect_operand = True
+
+    # true right after '*', '+', '?' or {m,n}, another one would have to repeat the repetition
+    after_repeat = False
+
+    def push_operator(operator: int, position: int) -> None:
+        # operators are left associative, pop the ones with the same or higher precedence first
+        while operators and operators[-1][0] != OPEN_PARENTHESIS and \
+                PRECEDENCE[operators[-1][0]] >= PRECEDENCE[operator]:
+            output.append(operators.pop()[0])
+        operators.append((operator, position))
+
+    i = 0
+    while i < len(regex):
+        ch = regex[i]
+        if ch not in UNARY_OPERATORS and ch != '{':
+            after_repeat = False
+        if ch == '(' and i + 1 < len(regex) and regex[i + 1] == ')':
+            # empty parentheses are an epsilon operand
+            if not expect_operand:
+                push_operator(CONCATENATION, i)
+            output.append(EPSILON)
+            expect_operand = False
+            i += 2
+        elif ch == '(':
+            if not expect_operand:
+                push_operator(CONCATENATION, i)
+            operators.append((OPEN_PARENTHESIS, i))
+            expect_operand = True
+            i += 1
+        elif ch == ')':
+            if expect_operand:
+                raise RegexSyntaxError("Missing operand after '|'", operators[-1][1]) \
+                    if operators and operators[-1][0] == ALTERNATION else RegexSyntaxError("Unbalanced ')'", i)
+            while operators and operators[-1][0] != OPEN_PARENTHESIS:
+                output.append(operators.pop()[0])
+            if not operators:
+                raise RegexSyntaxError("Unbalanced ')'", i)
+            operators.pop()
+            i += 1
+        elif ch == '|':
+            if expect_operand:
+                raise RegexSyntaxError("Missing operand before '|'", i)
+            push_operator(ALTERNATION, i)
+            expect_operand = True
+            i += 1
+        elif ch in UNARY_OPERATORS or ch == '{':
+            if expect_operand:
+                raise RegexSyntaxError(f"Nothing to repeat with '{ch}'", i)
+            # like in re, a**, a+? or a{2}{3} need parentheses, which also keeps nested repetition visible
+            if after_repeat:
+                raise RegexSyntaxError(f"Multiple repeat with '{ch}'", i)
+            after_repeat = True
+            # postfix operators have the highest precedence and go straight to the output
+            if ch == '{':
+                repeat, i = parse_repeat(regex, i)
+                output.append(repeat)
+            else:
+                output.append(UNARY_OPERATORS[ch])
+                i += 1
+        else:
+            if not expect_operand:
+                push_operator(CONCATENATION, i)
+            symbol, i = parse_symbol(regex, i)
+            output.append(symbol)
+            expect_operand = False
+
+    if expect_operand:
+        if operators and operators[-1][0] == ALTERNATION:
+            raise RegexSyntaxError("Missing operand after '|'", operators[-1][1])
+        if operators:
+            raise RegexSyntaxError("Unbalanced '('", operators[-1][1])
+        # empty regex matches the empty string
+        output.append(EPSILON)
+
+    while operators:
+        operator, position = operators.pop()
+        if operator == OPEN_PARENTHESIS:
+            raise RegexSyntaxError("Unbalanced '('", position)
+        output.append(operator)
+
+    return output
+
+
+def parse_symbol(regex: str, i: int) -> Tuple[Symbol, int]:
     """
-    Replaces epsilon identifier () with the epsilon symbol.
+    Parses a single character, escape sequence, '.' or character class starting at regex[i].
+    Classes of a single character are returned as the character itself.
+    :return: (symbol, index after the symbol)
     """
-    for i in range(len(regex) - 1):
-        if regex[i] == '(' and regex[i + 1] == ')':
-            # replace empty parentheses with epsilon symbol
-            regex[i] = EPSILON
-            regex.pop(i + 1)
-    return regex
+    ch = regex[i]
+    if ch == '.':
+        return CharClass.any_char(), i + 1
+    if ch == '\\':
+        return parse_escape(regex, i)
+    if ch == '[':
+        char_class, end = parse_class(regex, i)
+        if len(char_class) == 1:
+            return chr(char_class.ranges[0][0]), end
+        return char_class, end
+    return ch, i + 1
 
 
-def format_list(tokens: list) -> list:
+def parse_escape(regex: str, i: int) -> Tuple[Symbol, int]:
     """
-    Turns list with parenthesis into a nested python list.
-    First end last parenthesis must be inserted before calling this function.
-    Example: ['(', '1', '(', '2', '3'), '4', ')'] -> ['1', ['2', '3'], '4']
+    Parses an escape sequence starting at regex[i] == '\\'.
+    \\d, \\w, \\s and their negations \\D, \\W, \\S are classes, \\n, \\t, \\r, \\f, \\v are control characters,
+    \\xHH, \\uHHHH and \\UHHHHHHHH are code points, any other escaped character stands for itself.
+    :return: (single character or class, index after the escape sequence)
     """
-    token = tokens.pop(0)
-    if token == '(':
-        inside = []
-        # parse the inside of the parenthesis recursively
-        while tokens[0] != ')':
-            inside.append(format_list(tokens))
-        tokens.pop(0)
-        return inside
-    return token
+    if i + 1 >= len(regex):
+        raise RegexSyntaxError("Incomplete escape sequence", i)
+
+    escape = regex[i + 1]
+    if escape.lower() in ESCAPE_CLASSES:
+        char_class = ESCAPE_CLASSES[escape.lower()]
+        return (char_class.negated() if escape.isupper() else char_class), i + 2
+    if escape in ESCAPE_CHARACTERS:
+        return ESCAPE_CHARACTERS[escape], i + 2
+    if escape in HEX_ESCAPE_DIGITS:
+        end = i + 2 + HEX_ESCAPE_DIGITS[escape]
+        digits = regex[i + 2:end]
+        if len(digits) != HEX_ESCAPE_DIGITS[escape] or any(digit not in string.hexdigits for digit in digits):
+            raise RegexSyntaxError(f"Invalid escape sequence '\\{escape}'", i)
+        code = int(digits, 16)
+        if code > MAX_CODE_POINT:
+            raise RegexSyntaxError(f"Invalid code point '\\{escape}{digits}'", i)
+        return chr(code), end
+    return escape, i + 2
 
 
-def evaluate(regex: list) -> NFA:
+def parse_class(regex: str, i: int) -> Tuple[CharClass, int]:
     """
-    Evaluates list with NFAs and regular operations. recursively calls itself
-    on nested lists and replaces it with equivalent epsilon-NFA.
-    :param regex: list containing NFAs, regular operations and nested lists
-    :return: corresponding NFA
+    Parses a character class starting at regex[i] == '['. A class is negated by a leading '^',
+    a ']' right after '[' or '[^' is a literal and so is a '-' at the start or the end of the class.
+    :return: (class, index after the closing ']')
     """
-    for i in range(len(regex)):
-        if isinstance(regex[i], list):
-            regex[i] = evaluate(regex[i])
+    start = i
+    i += 1
+    negated = i < len(regex) and regex[i] == '^'
+    if negated:
+        i += 1
 
-    if len(regex) == 1:
-        return regex[0]
+    ranges = []
+    first_item = True
+    while True:
+        if i >= len(regex):
+            raise RegexSyntaxError("Unterminated character class", start)
+        if regex[i] == ']' and not first_item:
+            i += 1
+            break
+        first_item = False
 
-    # kleene star operations first
-    for i in range(len(regex) - 1, -1, -1):
-        if regex[i] == '*':
-            regex[i - 1].kleene_star()
-            regex.pop(i)
+        item_position = i
+        first, i = _parse_class_item(regex, i)
+        if isinstance(first, CharClass):
+            ranges.extend(first.ranges)
+            continue
+
+        if i + 1 < len(regex) and regex[i] == '-' and regex[i + 1] != ']':
+            last, i = _parse_class_item(regex, i + 1)
+            if isinstance(last, CharClass) or last < first:
+                raise RegexSyntaxError("Invalid character range", item_position)
+            ranges.append((first, last))
+        else:
+            ranges.append((first, first))
+
+    char_class = CharClass(ranges)
+    return (char_class.negated() if negated else char_class), i
+
+
+def _parse_class_item(regex: str, i: int) -> Tuple[Union[int, CharClass], int]:
+    # returns a code point, or a class for escapes like \\d
+    if regex[i] != '\\':
+        return ord(regex[i]), i + 1
+    symbol, end = parse_escape(regex, i)
+    return (ord(symbol) if isinstance(symbol, str) else symbol), end
+
+
+def parse_repeat(regex: str, i: int) -> Tuple[Repeat, int]:
+    """
+    Parses bounded repetition {m}, {m,} or {m,n} starting at regex[i] == '{'.
+    :return: (repetition operator, index after the closing '}')
+    """
+    end = regex.find('}', i)
+    if end == -1:
+        raise RegexSyntaxError("Unterminated repetition", i)
 
-    # concatenation second
-    for i in range(len(regex) - 2, -1, -1):
-        if regex[i] != '|' and regex[i + 1] != '|':
-            regex[i].concatenation(regex.pop(i + 1))
+    bounds = regex[i + 1:end].split(',')
+    if len(bounds) > 2 or not bounds[0].isdigit() or (len(bounds) == 2 and bounds[1] and not bounds[1].isdigit()):
+        raise RegexSyntaxError("Invalid repetition", i)
 
-    # alternation last
-    for i in range(len(regex) - 1, -1, -1):
-        if regex[i] == '|':
-            regex.pop(i)
-            regex[i - 1].alternation(regex[i])
-            regex.pop(i)
+    minimum = int(bounds[0])
+    if len(bounds) == 1:
+        maximum: Optional[int] = minimum
+    else:
+        maximum = int(bounds[1]) if bounds[1] else None
 
-    return regex[0]
+    if maximum is not None and maximum < minimum:
+        raise RegexSyntaxError("Invalid repetition, minimum is larger than maximum", i)
+    if max(minimum, maximum or 0) > MAX_REPEAT:
+        raise RegexSyntaxError(f"Repetition count is larger than {MAX_REPEAT}", i)
+    return Repeat(minimum, maximum, i), end + 1
 
 
-def regex_to_nfa(regex: str) -> NFA:
+def shared_subexpressions(postfix: list, min_tokens: int = MIN_SHARED_TOKENS,
+                          min_occurrences: int = MIN_SHARED_OCCURRENCES) -> Dict[int, list[Tuple[int, int]]]:
+    """
+    Finds subexpressions that occur more than once in the postfix token stream by hash-consing: every subtree
+    gets the id of its operator together with the ids of its operands, so identical subtrees get the same id.
+    :param postfix: symbols and operators, as returned by to_postfix
+    :param min_tokens: smaller subexpressions are cheaper to build again than to share
+    :param min_occurrences: subexpressions that occur fewer times are cheaper to build again than to share
+    :return: {index of the first token of a repeated subexpression: [(index of its last token, subtree id)]},
+        longest subexpressions first, only for subexpressions evaluate copies at least once
+    """
+    # every subexpression is disjoint from the other occurrences of it, short streams can not have any
+    if len(postfix) < min_tokens * min_occurrences:
+        return {}
+
+    subtree_ids: Dict[object, int] = {}
+
+    # subtree id and index of the first token of the subexpression ending at every token.
+    # the operands of an operator end right before it and right before the first token of its second operand
+    ids: list[int] = []
+    begins: list[int] = []
+
+    for index, token in enumerate(postfix):
+        if type(token) is int:
+            if token == CONCATENATION or token == ALTERNATION:
+                first = begins[index - 1] - 1
+                key = (token, ids[first], ids[index - 1])
+            else:
+                first = index - 1
+                key = (token, ids[first])
+            begin = begins[first]
+        elif isinstance(token, Repeat):
+            # the position is not part of the operator, the same repetition elsewhere is the same subtree
+            key = ((token.minimum, token.maximum), ids[index - 1])
+            begin = begins[index - 1]
+        else:
+            # symbols are strings or character classes, they never equal the tuple keys of operators
+            key = token
+            begin = index
+
+        ids.append(subtree_ids.setdefault(key, len(subtree_ids)))
+        begins.append(begin)
+
+    # most regexes have no large repeated subexpression, they are done after a single pass over the ids
+    counts = Counter(ids)
+    frequent = {subtree_id for subtree_id, count in counts.items() if count >= min_occurrences}
+    repeated: Dict[int, list[Tuple[int, int]]] = {}
+    if frequent:
+        for end, subtree_id in enumerate(ids):
+            if subtree_id in frequent and end - begins[end] + 1 >= min_tokens:
+                repeated.setdefault(begins[end], []).append((end, subtree_id))
+    if not repeated:
+        return repeated
+    for subexpressions in repeated.values():
+        subexpressions.sort(reverse=True)
+
+    # walk the tokens like evaluate does, a subexpression is only worth a template if one of its later
+    # occurrences is copied, and not skipped as part of a longer copied subexpression.
+    # only the first and last tokens of repeated subexpressions matter
+    built: Set[int] = set()
+    copied: Set[int] = set()
+    ends = {end: subtree_id for subexpressions in repeated.values() for end, subtree_id in subexpressions}
+    skip_to = 0
+    for index in sorted(repeated.keys() | ends.keys()):
+        if index < skip_to:
+            continue
+        end, subtree_id = next(((end, subtree_id) for end, subtree_id in repeated.get(index, ())
+                                if subtree_id in built), (None, None))
+        if end is not None:
+            copied.add(subtree_id)
+            skip_to = end + 1
+        elif index in ends:
+            built.add(ends[index])
+
+    return {begin: [(end, subtree_id) for end, subtree_id in subexpressions if subtree_id in copied]
+            for begin, subexpressions in repeated.items()
+            if any(subtree_id in copied for _, subtree_id in subexpressions)}
+
+
+def evaluate(postfix: list, builder: ThompsonBuilder, share_subexpressions: bool = False) -> Fragment:
+    """
+    Evaluates postfix token stream with a stack of NFA fragments.
+    :param postfix: symbols and operators, as returned by to_postfix
+    :param builder: builder that owns the fragments
+    :param share_subexpressions: build every repeated subexpression only once, later occurrences are copies
+        of its epsilon-free template (see ThompsonBuilder.template) instead of new Thompson fragments
+    :return: fragment corresponding to the whole stream
+    """
+    stack: list[Fragment] = []
+
+    # index of the first state of every fragment on the stack in builder.states,
+    # all states created from then on belong to the fragment, which lets bounded repetition copy it
+    begins: list[int] = []
+
+    repeated = shared_subexpressions(postfix) if share_subexpressions else {}
+    repeated_ends: Dict[int, int] = {end: subtree_id for subexpressions in repeated.values()
+                                     for end, subtree_id in subexpressions}
+    templates: Dict[int, FragmentTemplate] = {}
+
+    # states added by the copies of bounded repetition in every fragment on the stack, and in every template.
+    # nested repetition multiplies them, so their total is limited before any copy is made
+    expansions: list[int] = []
+    template_expansions: Dict[int, int] = {}
+    total_expansion = 0
+
+    i = 0
+    while i < len(postfix):
+        # the longest subexpression starting here that was built before is copied, and its tokens are skipped
+        template_end = next((end for end, subtree_id in repeated.get(i, ()) if subtree_id in templates), None)
+        if template_end is not None:
+            # counted as if the subexpression was built again, so sharing does not change which regexes fail
+            subtree_id = repeated_ends[template_end]
+            total_expansion += template_expansions[subtree_id]
+            if total_expansion > MAX_REPEAT_STATES:
+                position = next(token.position for token in postfix[i:template_end + 1] if isinstance(token, Repeat))
+                raise RegexSyntaxError(f"Repetition makes the automaton larger than {MAX_REPEAT_STATES} states",
+                                       position)
+            begins.append(len(builder.states))
+            expansions.append(template_expansions[subtree_id])
+            stack.append(builder.instantiate(templates[subtree_id]))
+            i = template_end + 1
+            continue
+
+        token = postfix[i]
+        if isinstance(token, Repeat):
+            count = max(token.minimum, 1) if token.maximum is None else token.maximum
+            copies = max(count - 1, 0)
+            added = (len(builder.states) - begins[-1]) * copies
+            total_expansion += added
+            if total_expansion > MAX_REPEAT_STATES:
+                raise RegexSyntaxError(f"Repetition makes the automaton larger than {MAX_REPEAT_STATES} states",
+                                       token.position)
+            expansions[-1] += added
+            fragment = stack.pop()
+            stack.append(builder.repeat(fragment, begins[-1], len(builder.states), token.minimum, token.maximum))
+        elif token == KLEENE_STAR:
+            stack.append(builder.kleene_star(stack.pop()))
+        elif token == PLUS:
+            stack.append(builder.plus(stack.pop()))
+        elif token == OPTIONAL:
+            stack.append(builder.optional(stack.pop()))
+        elif token == CONCATENATION:
+            second = stack.pop()
+            begins.pop()
+            expansions.append(expansions.pop() + expansions.pop())
+            stack.append(builder.concatenation(stack.pop(), second))
+        elif token == ALTERNATION:
+            second = stack.pop()
+            begins.pop()
+            expansions.append(expansions.pop() + expansions.pop())
+            stack.append(builder.alternation(stack.pop(), second))
+        else:
+            begins.append(len(builder.states))
+            expansions.append(0)
+            stack.append(builder.symbol(token))
+
+        # the first occurrence of a repeated subexpression is complete, later ones are copied from it
+        subtree_id = repeated_ends.get(i)
+        if subtree_id is not None and subtree_id not in templates:
+            templates[subtree_id] = builder.template(stack[-1], begins[-1])
+            template_expansions[subtree_id] = expansions[-1]
+        i += 1
+    return stack.pop()
+
+
+def regex_to_nfa(regex: str, metrics: Optional[Metrics] = None, share_subexpressions: bool = False) -> NFA:
     """
     Takes string representing regular expression and returns epsilon-NFA
     which accepts the same language as the regular expression.
     :param regex: regular expression
+    :param metrics: collects the time spent parsing and building the automaton, and its size
+    :param share_subexpressions: build repeated subexpressions once and copy them, see evaluate
     :return: corresponding epsilon-NFA
     """
-    regex = format_epsilon(list(regex))
+    metrics = metrics or DISABLED
+    with metrics.phase('parse'):
+        postfix = to_postfix(regex)
+    with metrics.phase('thompson'):
+        builder = ThompsonBuilder()
+        nfa = builder.to_nfa(evaluate(postfix, builder, share_subexpressions))
+    metrics.automaton('thompson', nfa)
+    return nfa
+
+
+def compile_regex(regex: str, metrics: Optional[Metrics] = None) -> NFA:
+    """
+    Takes string representing regular expression and returns the epsilon-free, reduced NFA
+    which accepts the same language, the same automaton build.py prints.
+    :param regex: regular expression
+    :param metrics: collects the time spent in every phase and the size of the automaton after it
+    :return: corresponding NFA without epsilon transitions
+    """
+    metrics = metrics or DISABLED
+    nfa: NFA = regex_to_nfa(regex, metrics, share_subexpressions=True)
+    with metrics.phase('remove_epsilon'):
+        nfa.remove_epsilon()
+    metrics.automaton('remove_epsilon', nfa)
+    with metrics.phase('reduce'):
+        nfa.reduce()
+    metrics.automaton('reduce', nfa)
+    return nfa
+
 
-    # replace each symbols with corresponding NFA
-    for i in range(len(regex)):
-        if regex[i] != '(' and regex[i] != ')' and regex[i] != '|' and regex[i] != '*':
-            states = get_states_list(2)
-            regex[i] = NFA([states[0], states[1]], regex[i],
-                           {states[0]: {regex[i]: {states[1]}}}, states[0], {states[1]})
+def regex_to_dfa(regex: str, max_states: int = DEFAULT_MAX_DFA_STATES, metrics: Optional[Metrics] = None) -> NFA:
+    """
+    Takes string representing regular expression and returns the minimal DFA
+    which accepts the same language, in the NFA representation.
+    :param regex: regular expression
+    :param max_states: maximum number of states of the intermediate DFA
+    :param metrics: collects the time spent in every phase and the size of the automaton after it
+    :return: corresponding minimal DFA
+    """
+    metrics = metrics or DISABLED
+    nfa = compile_regex(regex, metrics)
+    with metrics.phase('determinize'):
+        dfa = determinize(nfa, max_states)
+    metrics.automaton('determinize', dfa)
+    with metrics.phase('minimize'):
+        dfa = minimize(dfa)
+    metrics.automaton('minimize', dfa)
+    return dfa
 
-    # adding parenthesis at the beginning and the end is needed for the formatting to work
-    regex.insert(0, '(')
-    regex.append(')')
-    regex_list = format_list(regex)
 
-    return evaluate(regex_list)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Reads a regular expression and prints the equivalent NFA")
+    parser.add_argument('--dfa', action='store_true',
+                        help="determinize and minimize the automaton before printing it")
+    parser.add_argument('--max-states', type=int, default=DEFAULT_MAX_DFA_STATES,
+                        help="maximum number of DFA states created by the subset construction")
+    parser.add_argument('--format', choices=['text', 'binary'], default='text',
+                        help="output format of the automaton, see serialization.py for the binary format")
+    parser.add_argument('--stats', action='store_true',
+                        help="print the time spent in every phase and the automaton sizes to stderr")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     regex: str = input()
-    nfa: NFA = regex_to_nfa(regex)
-    nfa.remove_epsilon()
-    nfa.reduce()
-    print(nfa)
+    metrics = Metrics() if args.stats else None
+
+    try:
+        if args.dfa:
+            nfa: NFA = regex_to_dfa(regex, args.max_states, metrics)
+        else:
+            nfa: NFA = compile_regex(regex, metrics)
+    except RegexSyntaxError as error:
+        sys.exit(f"error: {error}\n{regex}\n{' ' * error.position}^")
+    except DFAStateLimitError as error:
+        sys.exit(f"error: {error}, the regular expression is too large to determinize")
+
+    if args.format == 'binary':
+        serialization.write_binary(nfa, sys.stdout.buffer)
+    else:
+        print(nfa)
+
+    if metrics is not None:
+        print(metrics.report(), file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import build
+import serialization
+from automaton import NFA
+
+CACHE_MAGIC = b'R2NC'
+CACHE_FORMAT_VERSION = 2  # must be increased whenever the format of cache files changes
+
+# cache files are the magic, the version as uint16, the length of the utf-8 key as uint32, the key and the automaton
+# in the binary format of serialization.py. they only hold data, so a shared directory can not inject code
+KEY_LENGTH = struct.Struct('<I')
+DEFAULT_CACHE_ENTRIES = 128
+
+
+def normalize_regex(regex: str) -> str:
+    """
+    Normalizes the regular expression so equivalent spellings share a cache entry.
+    Redundant parentheses around the whole expression are removed. Whitespace is kept,
+    since spaces are literal characters of the regex.
+    """
+    while len(regex) > 2 and regex[0] == '(' and _matching_parenthesis(regex, 0) == len(regex) - 1:
+        regex = regex[1:-1]
+    return regex
+
+
+def _matching_parenthesis(regex: str, index: int) -> int:
+    # escaped parentheses and parentheses inside character classes are literals and are skipped
+    depth = 0
+    in_class = False
+    i = index
+    while i < len(regex):
+        ch = regex[i]
+        if ch == '\\':
+            i += 1
+        elif in_class:
+            in_class = ch != ']'
+        elif ch == '[':
+            in_class = True
+            # a ']' right after '[' or '[^' is a literal
+            if regex[i + 1:i + 2] == '^':
+                i += 1
+            if regex[i + 1:i + 2] == ']':
+                i += 1
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+class AutomatonCache:
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES, directory: Optional[str] = None) -> None:
+        """
+        Initializes a cache of compiled automata keyed by normalized regular expressions.
+
+        :param max_entries: maximum number of automata kept in memory, the least recently used one is evicted
+        :param directory: directory for cache files shared between processes, in-memory only if None
+        """
+        if max_entries < 1:
+            raise ValueError("Automaton cache must hold at least 1 entry")
+
+        self.max_entries = max_entries
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self._entries: OrderedDict[str, NFA] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+
+    def get(self, regex: str) -> NFA:
+        """
+        Returns the compiled (epsilon-free and reduced) NFA for the regular expression,
+        compiling it only if it is neither in memory nor on disk.
+        The returned NFA is shared with the cache and must not be modified.
+        """
+        key = normalize_regex(regex)
+
+        nfa = self._entries.get(key)
+        if nfa is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return nfa
+
+        self.misses += 1
+        nfa = self._load(key)
+        if nfa is None:
+            nfa = build.compile_regex(key)
+            self._store(key, nfa)
+        else:
+            self.disk_hits += 1
+
+        self._entries[key] = nfa
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return nfa
+
+    def clear(self) -> None:
+        """
+        Drops all automata kept in memory, files on disk are kept.
+        """
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'disk_hits': self.disk_hits,
+            'disk_writes': self.disk_writes,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, regex: str) -> bool:
+        return normalize_regex(regex) in self._entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + '.nfa')
+
+    def _load(self, key: str) -> Optional[NFA]:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as cache_file:
+                data = cache_file.read()
+        except FileNotFoundError:
+            return None
+
+        # files written by other versions, damaged files and hash collisions are treated as misses
+        header = CACHE_MAGIC + CACHE_FORMAT_VERSION.to_bytes(2, 'little')
+        if not data.startswith(header) or len(data) < len(header) + KEY_LENGTH.size:
+            return None
+        (key_length,) = KEY_LENGTH.unpack_from(data, len(header))
+        key_start = len(header) + KEY_LENGTH.size
+        if data[key_start:key_start + key_length] != key.encode():
+            return None
+        try:
+            return serialization.loads(data[key_start + key_length:]).to_nfa()
+        except (ValueError, struct.error):
+            return None
+
+    def _store(self, key: str, nfa: NFA) -> None:
+        if self.directory is None:
+            return
+
+        encoded_key = key.encode()
+        data = b''.join([CACHE_MAGIC, CACHE_FORMAT_VERSION.to_bytes(2, 'little'), KEY_LENGTH.pack(len(encoded_key)),
+                         encoded_key, serialization.dumps(nfa)])
+
+        # write to a temporary file first, so other processes never see a partially written file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as cache_file:
+                cache_file.write(data)
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        self.disk_writes += 1
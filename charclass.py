@@ -0,0 +1,203 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple, Union
+
+MAX_CODE_POINT = 0x10FFFF
+
+# characters that are written with a backslash inside a printed class
+ESCAPED_CLASS_CHARACTERS = '\\]-^['
+
+
+class CharClass:
+    """
+    Immutable set of characters, stored as sorted, disjoint and non-adjacent ranges of code points.
+    Used as a single transition label instead of one transition per character.
+    """
+    __slots__ = ('ranges', '_starts', '_hash')
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]]) -> None:
+        """
+        :param ranges: inclusive (first, last) code point ranges, in any order, may overlap
+        """
+        merged: list[Tuple[int, int]] = []
+        for first, last in sorted(ranges):
+            if first > last:
+                raise ValueError(f"Invalid character range {first}-{last}")
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+
+        self.ranges: Tuple[Tuple[int, int], ...] = tuple(merged)
+        self._starts = [first for first, _ in merged]
+        self._hash = hash(self.ranges)
+
+    @classmethod
+    def from_chars(cls, chars: Iterable[str]) -> 'CharClass':
+        return cls((ord(ch), ord(ch)) for ch in chars)
+
+    @classmethod
+    def any_char(cls) -> 'CharClass':
+        return cls([(0, MAX_CODE_POINT)])
+
+    def negated(self) -> 'CharClass':
+        complement = []
+        next_first = 0
+        for first, last in self.ranges:
+            if first > next_first:
+                complement.append((next_first, first - 1))
+            next_first = last + 1
+        if next_first <= MAX_CODE_POINT:
+            complement.append((next_first, MAX_CODE_POINT))
+        return CharClass(complement)
+
+    def union(self, other: 'CharClass') -> 'CharClass':
+        return CharClass(self.ranges + other.ranges)
+
+    def __contains__(self, ch: str) -> bool:
+        code = ord(ch)
+        i = bisect_right(self._starts, code) - 1
+        return i >= 0 and code <= self.ranges[i][1]
+
+    def __len__(self) -> int:
+        return sum(last - first + 1 for first, last in self.ranges)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CharClass) and self.ranges == other.ranges
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __str__(self) -> str:
+        parts = ['[']
+        for first, last in self.ranges:
+            parts.append(_format_class_char(first))
+            if last > first:
+                parts.append('-' + _format_class_char(last))
+        parts.append(']')
+        return ''.join(parts)
+
+    def __repr__(self) -> str:
+        return f"CharClass({str(self)!r})"
+
+    @classmethod
+    def parse(cls, label: str) -> 'CharClass':
+        """
+        Parses a class printed by __str__, as found in the text format of an NFA.
+        """
+        if len(label) < 2 or label[0] != '[' or label[-1] != ']':
+            raise ValueError(f"Invalid character class {label!r}")
+
+        codes = []
+        i = 1
+        while i < len(label) - 1:
+            if label[i] == '-' and codes and i + 1 < len(label) - 1:
+                codes.append(None)
+                i += 1
+                continue
+            code, i = _parse_class_char(label, i)
+            codes.append(code)
+
+        ranges = []
+        i = 0
+        while i < len(codes):
+            if i + 2 < len(codes) and codes[i + 1] is None:
+                ranges.append((codes[i], codes[i + 2]))
+                i += 3
+            else:
+                ranges.append((codes[i], codes[i]))
+                i += 1
+        return cls(ranges)
+
+
+Symbol = Union[str, CharClass]
+
+
+def label_matches(label: Symbol, ch: str) -> bool:
+    return label == ch if isinstance(label, str) else ch in label
+
+
+def label_ranges(label: Symbol) -> Tuple[Tuple[int, int], ...]:
+    if isinstance(label, CharClass):
+        return label.ranges
+    return (ord(label), ord(label)),
+
+
+def label_sort_key(label: Symbol) -> tuple:
+    # single characters first, then classes, so mixed labels can be sorted deterministically
+    if isinstance(label, CharClass):
+        return 1, label.ranges
+    return 0, label
+
+
+def split_ranges(labels: Iterable[Symbol]) -> List[Tuple[int, int]]:
+    """
+    Splits the characters of the labels into the fewest disjoint ranges such that every label is a union of some
+    of them. Subset construction uses the ranges as its alphabet, so overlapping labels lead to a deterministic
+    automaton without enumerating single characters.
+    :return: sorted (first, last) code point ranges, characters not matched by any label are left out
+    """
+    # +1 where a range of a label starts and -1 after it ends, the ranges are split at every such point
+    events: Dict[int, int] = {}
+    for label in labels:
+        for first, last in label_ranges(label):
+            events[first] = events.get(first, 0) + 1
+            events[last + 1] = events.get(last + 1, 0) - 1
+
+    points = sorted(events)
+    result = []
+    depth = 0
+    for point, next_point in zip(points, points[1:]):
+        depth += events[point]
+        if depth > 0:
+            result.append((point, next_point - 1))
+    return result
+
+
+def range_label(first: int, last: int) -> Symbol:
+    # single characters stay plain strings, so they can be looked up directly in transitions
+    return chr(first) if first == last else CharClass([(first, last)])
+
+
+def format_label(label: Symbol) -> str:
+    """
+    Returns the label as a single token of the NFA text format.
+    Whitespace characters would split the token, so they are written as one-character classes.
+    """
+    if isinstance(label, CharClass):
+        return str(label)
+    if isinstance(label, str) and len(label) == 1 and (label.isspace() or not label.isprintable()):
+        return str(CharClass.from_chars(label))
+    return str(label)
+
+
+def parse_label(token: str) -> Symbol:
+    """
+    Inverse of format_label.
+    """
+    if len(token) > 1 and token[0] == '[' and token[-1] == ']':
+        return CharClass.parse(token)
+    return token
+
+
+def _format_class_char(code: int) -> str:
+    ch = chr(code)
+    if ch in ESCAPED_CLASS_CHARACTERS:
+        return '\\' + ch
+    if ch.isspace() or not ch.isprintable():
+        if code <= 0xFF:
+            return f"\\x{code:02x}"
+        if code <= 0xFFFF:
+            return f"\\u{code:04x}"
+        return f"\\U{code:08x}"
+    return ch
+
+
+def _parse_class_char(label: str, i: int) -> Tuple[int, int]:
+    if label[i] != '\\':
+        return ord(label[i]), i + 1
+
+    escape = label[i + 1]
+    digits = {'x': 2, 'u': 4, 'U': 8}.get(escape)
+    if digits is None:
+        return ord(escape), i + 2
+    return int(label[i + 2:i + 2 + digits], 16), i + 2 + digits
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import Any, Dict
+
+# same as server.DEFAULT_SOCKET_PATH, not imported so the client starts without loading the compiler
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'regex2nfa.sock')
+
+
+class ServerError(RuntimeError):
+    pass
+
+
+def request(message: Dict[str, Any], path: str = DEFAULT_SOCKET_PATH) -> Any:
+    """
+    Sends one request to the server listening on the Unix domain socket and returns its result.
+    Raises ServerError with the message of the server if the request failed, and OSError if no server is running.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(json.dumps(message).encode() + b'\n')
+        with connection.makefile('rb') as responses:
+            line = responses.readline()
+    if not line:
+        raise ServerError("Server closed the connection")
+
+    response = json.loads(line)
+    if 'error' in response:
+        raise ServerError(response['error'])
+    return response['result']
+
+
+def match_locally(input_string: str, regex: str) -> str:
+    # used when no server is running, it still saves the second interpreter and the text round trip of regex.sh
+    import build
+    import run
+    return run.simulate(input_string, build.compile_regex(regex))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulates a string on a regular expression using the server "
+                                                 "started with 'python server.py --socket', printing 'Y' and 'N' "
+                                                 "for every character like regex.sh")
+    parser.add_argument('string', help="input string")
+    parser.add_argument('regex', help="regular expression")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help="path of the server socket")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        result = request({'op': 'match', 'regex': args.regex, 'input': args.string}, args.socket)
+    except ServerError as error:
+        sys.exit(f"error: {error}")
+    except OSError:
+        try:
+            result = match_locally(args.string, args.regex)
+        except ValueError as error:
+            sys.exit(f"error: {error}")
+    print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Set
+
+from automaton import NFA
+from charclass import CharClass, label_sort_key
+
+MAX_CACHED_STEPS = 4096  # simulation steps remembered by CompactNFA.simulate before the cache is cleared
+
+
+class CompactNFA:
+    """
+    Immutable array-backed form of an epsilon-free NFA.
+
+    States are renumbered to 0..n-1 in the order of NFA.states and symbols are interned to 0..k-1.
+    Transitions are stored CSR-style: the transitions of state s are offsets[s]:offsets[s + 1], sorted by
+    symbol and destination, transition t goes to targets[t] on the symbol labels[t]. The arrays grow with
+    the number of transitions, not with the number of states times the number of symbols.
+    Accept states are bits of accept_mask.
+    """
+    __slots__ = ('state_names', 'symbols', 'symbol_ids', 'start_state', 'accept_mask', 'offsets', 'labels',
+                 'targets', '_accepting')
+
+    def __init__(self, state_names: array, symbols: tuple, start_state: int, accept_mask: int,
+                 offsets: array, labels: array, targets: array) -> None:
+        """
+        :param state_names: original NFA state for every compact state
+        :param symbols: interned symbols, the symbol id is the index in the tuple
+        :param start_state: compact id of the start state
+        :param accept_mask: bitset of accepting compact states
+        :param offsets: array of length n + 1 with the index of the first transition of every state
+        :param labels: symbol ids of all transitions
+        :param targets: destination states of all transitions
+        """
+        object.__setattr__(self, 'state_names', state_names)
+        object.__setattr__(self, 'symbols', symbols)
+        object.__setattr__(self, 'symbol_ids', {symbol: i for i, symbol in enumerate(symbols)})
+        object.__setattr__(self, 'start_state', start_state)
+        object.__setattr__(self, 'accept_mask', accept_mask)
+        object.__setattr__(self, 'offsets', offsets)
+        object.__setattr__(self, 'labels', labels)
+        object.__setattr__(self, 'targets', targets)
+
+        # shifting a large mask for every lookup is slow, so lookups use one flag byte per state
+        accepting = bytearray(len(state_names))
+        mask_bytes = accept_mask.to_bytes((len(state_names) + 7) // 8, 'little')
+        for i, byte in enumerate(mask_bytes):
+            while byte:
+                lowest_bit = byte & -byte
+                accepting[i * 8 + lowest_bit.bit_length() - 1] = 1
+                byte ^= lowest_bit
+        object.__setattr__(self, '_accepting', accepting)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("CompactNFA is immutable")
+
+    @classmethod
+    def from_nfa(cls, nfa: NFA) -> 'CompactNFA':
+        state_ids: Dict[int, int] = {state: i for i, state in enumerate(nfa.states)}
+
+        symbols = set()
+        for state in nfa.transitions:
+            symbols.update(nfa.transitions[state])
+        symbols = tuple(sorted(symbols, key=label_sort_key))
+        symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+
+        offsets = array('i', [0])
+        labels = array('i')
+        targets = array('i')
+        for state in nfa.states:
+            state_transitions = nfa.transitions.get(state, {})
+            for symbol in sorted(state_transitions, key=symbol_ids.__getitem__):
+                destinations = sorted(state_ids[destination] for destination in state_transitions[symbol])
+                labels.extend([symbol_ids[symbol]] * len(destinations))
+                targets.extend(destinations)
+            offsets.append(len(targets))
+
+        accept_mask = states_to_mask(state_ids[state] for state in nfa.accept_states if state in state_ids)
+
+        return cls(array('i', nfa.states), symbols, state_ids[nfa.start_state], accept_mask, offsets, labels,
+                   targets)
+
+    def accept_states(self) -> list[int]:
+        return [state for state in range(len(self.state_names)) if self._accepting[state]]
+
+    def to_nfa(self) -> NFA:
+        names = self.state_names
+
+        transitions: Dict[int, Dict[str, Set[int]]] = {}
+        for state in range(len(names)):
+            start, end = self.offsets[state], self.offsets[state + 1]
+            if start == end:
+                continue
+            state_transitions = transitions[names[state]] = {}
+            for transition in range(start, end):
+                symbol = self.symbols[self.labels[transition]]
+                if symbol not in state_transitions:
+                    state_transitions[symbol] = set()
+                state_transitions[symbol].add(names[self.targets[transition]])
+
+        accept_states = {names[state] for state in self.accept_states()}
+        return NFA(list(names), set(self.symbols), transitions, names[self.start_state], accept_states)
+
+    def simulate(self, input_string: str) -> str:
+        """
+        Simulates the input string and returns 'Y'/'N' for each prefix, same as run.simulate.
+        """
+        offsets, labels, targets, symbol_ids = self.offsets, self.labels, self.targets, self.symbol_ids
+        accepting = self._accepting
+
+        # ids of character class symbols, which have to be checked for every character that is not cached yet
+        class_ids = [(symbol_id, symbol) for symbol_id, symbol in enumerate(self.symbols)
+                     if isinstance(symbol, CharClass)]
+
+        # steps already taken in this simulation: (active states, symbol) -> (next active states, accepted).
+        # frozensets cache their hash, so a repeated step costs a single dictionary lookup
+        steps: Dict[tuple, tuple] = {}
+        dead_step = (frozenset(), False)
+
+        result: list[str] = []
+        current_states = frozenset([self.start_state])
+        for ch in input_string:
+            step = steps.get((current_states, ch))
+            if step is None:
+                matching = [symbol_id for symbol_id, char_class in class_ids if ch in char_class]
+                if ch in symbol_ids:
+                    matching.append(symbol_ids[ch])
+
+                if not matching:
+                    step = dead_step
+                else:
+                    next_states = set()
+                    for state in current_states:
+                        start, end = offsets[state], offsets[state + 1]
+                        for symbol in matching:
+                            # the transitions of a state on a symbol are a run in its transitions sorted by symbol
+                            low = bisect_left(labels, symbol, start, end)
+                            next_states.update(targets[low:bisect_right(labels, symbol, low, end)])
+                    step = (frozenset(next_states), any(accepting[state] for state in next_states))
+
+                if len(steps) >= MAX_CACHED_STEPS:
+                    steps.clear()
+                steps[(current_states, ch)] = step
+
+            current_states = step[0]
+            result.append('Y' if step[1] else 'N')
+
+        return ''.join(result)
+
+    def __len__(self) -> int:
+        return len(self.state_names)
+
+
+def states_to_mask(states: Iterable[int]) -> int:
+    """
+    Returns the bitset of the states, built in a byte array since or-ing large integers is slow.
+    """
+    states = list(states)
+    bits = bytearray((max(states, default=-1) + 8) // 8)
+    for state in states:
+        bits[state >> 3] |= 1 << (state & 7)
+    return int.from_bytes(bits, 'little')
@@ -0,0 +1,367 @@
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+from alphabet import NO_MATCH_CLASS, AlphabetPartition
+from automaton import NFA, EPSILON
+from charclass import label_ranges, label_sort_key, range_label, split_ranges
+from metrics import hit_rate
+
+DEFAULT_CACHE_SIZE = 4096  # maximum number of DFA states kept in the lazy DFA cache
+DEFAULT_MAX_DFA_STATES = 100000  # subset construction gives up after creating this many DFA states
+
+UNKNOWN_TRANSITION = -1  # entry of the lazy DFA table for a transition that is not computed yet
+
+
+class DFAStateLimitError(RuntimeError):
+    pass
+
+
+class LazyDFA:
+    def __init__(self, nfa: NFA, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Initializes a lazily built DFA on top of an epsilon-free NFA.
+        DFA states are subsets of NFA states and are created only when the simulation reaches them.
+        Transitions are indexed by the equivalence class of the character (see alphabet.py), so each state
+        has a dense row of the table and equivalent characters share a single computed transition.
+
+        :param nfa: epsilon-free NFA to simulate
+        :param cache_size: maximum number of DFA states kept in the cache before it is flushed
+        """
+        if cache_size < 2:
+            raise ValueError("Lazy DFA cache must hold at least 2 states")
+
+        self.nfa = nfa
+        self.cache_size = cache_size
+        self.flush_count = 0
+
+        # characters simulated by run and transitions that were not cached, for statistics
+        self.steps = 0
+        self.computed_transitions = 0
+
+        # DFA state id -> set of NFA states, and the reverse mapping. subclasses may use other hashable keys
+        self._state_sets: List[FrozenSet[int]] = []
+        self._state_ids: Dict[FrozenSet[int], int] = {}
+
+        # DFA state id -> 'Y' if it contains an accepting NFA state, 'N' otherwise
+        self._results: List[str] = []
+
+        self.alphabet = AlphabetPartition.from_nfa(nfa)
+
+        # DFA state id -> [DFA state id for every character class], filled in as transitions are computed
+        self._table: List[List[int]] = []
+
+        # NFA state -> [(character class, destinations)], checked besides the single character transitions
+        self._class_transitions = nfa.class_transitions()
+
+        self.start = self._add_state(self._initial_set())
+
+    def simulate(self, input_string: str) -> str:
+        """
+        Simulates the input string and returns 'Y'/'N' for each prefix, same as run.simulate.
+        """
+        return self.run(input_string, self.start)[0]
+
+    def run(self, input_string: str, state: int) -> Tuple[str, int]:
+        """
+        Simulates the input string starting from the given DFA state, which makes it possible
+        to continue the simulation of a longer input chunk by chunk.
+        :param input_string: next part of the input
+        :param state: DFA state reached after the previous part, self.start at the beginning
+        :return: 'Y'/'N' for each prefix ending in this part and the DFA state reached after it
+        """
+        result: List[str] = []
+        self.steps += len(input_string)
+
+        # local aliases, the cache is always cleared in place so they stay valid after a flush
+        table = self._table
+        results = self._results
+        append = result.append
+
+        for symbol_class in self.alphabet.translate(input_string):
+            next_state = table[state][symbol_class]
+            if next_state == UNKNOWN_TRANSITION:
+                next_state = self._compute_transition(state, symbol_class)
+            state = next_state
+            append(results[state])
+
+        return ''.join(result), state
+
+    def advance(self, input_string: str, state: int) -> int:
+        """
+        Same as run, but only returns the DFA state reached after the input, without the result of every prefix.
+        """
+        self.steps += len(input_string)
+        table = self._table
+        for symbol_class in self.alphabet.translate(input_string):
+            next_state = table[state][symbol_class]
+            if next_state == UNKNOWN_TRANSITION:
+                next_state = self._compute_transition(state, symbol_class)
+            state = next_state
+        return state
+
+    def is_accepting(self, state: int) -> bool:
+        return self._results[state] == 'Y'
+
+    def state_key(self, state: int) -> FrozenSet[int]:
+        """
+        Returns the set of NFA states of the DFA state. Unlike the state id, the set stays valid after a flush,
+        so it can be kept to continue the simulation later, see state_id.
+        """
+        return self._state_sets[state]
+
+    def state_id(self, key: FrozenSet[int]) -> int:
+        """
+        Returns the id of the DFA state with the set of NFA states returned by state_key,
+        adding the state to the cache if it was flushed since.
+        """
+        state = self._state_ids.get(key)
+        if state is not None:
+            return state
+        if len(self._state_sets) >= self.cache_size:
+            self.flush()
+            state = self._state_ids.get(key)
+            if state is not None:
+                return state
+        return self._add_state(key)
+
+    def flush(self) -> None:
+        """
+        Drops every cached DFA state and transition, only the start state is kept.
+        """
+        start_set = self._state_sets[self.start]
+        self._state_sets.clear()
+        self._state_ids.clear()
+        self._results.clear()
+        self._table.clear()
+        self.start = self._add_state(start_set)
+        self.flush_count += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'states': len(self._state_sets),
+            'flushes': self.flush_count,
+            'steps': self.steps,
+            'computed_transitions': self.computed_transitions,
+            'hit_rate': hit_rate(self.steps - self.computed_transitions, self.computed_transitions),
+        }
+
+    def _compute_transition(self, state: int, symbol_class: int) -> int:
+        self.computed_transitions += 1
+        next_set = self._successors(self._state_sets[state], symbol_class)
+
+        next_state = self._state_ids.get(next_set)
+        if next_state is not None:
+            self._table[state][symbol_class] = next_state
+            return next_state
+
+        if len(self._state_sets) >= self.cache_size:
+            # the cache is full, start over with an empty cache. the source state id is invalid after
+            # the flush, so the transition is not recorded, the simulation only needs the new state
+            self.flush()
+            next_state = self._state_ids.get(next_set)
+            if next_state is None:
+                next_state = self._add_state(next_set)
+            return next_state
+
+        next_state = self._add_state(next_set)
+        self._table[state][symbol_class] = next_state
+        return next_state
+
+    def _initial_set(self) -> FrozenSet[int]:
+        return frozenset([self.nfa.start_state])
+
+    def _successors(self, nfa_states: FrozenSet[int], symbol_class: int) -> FrozenSet[int]:
+        return frozenset(self._step(nfa_states, symbol_class))
+
+    def _is_accepting(self, nfa_states: FrozenSet[int]) -> bool:
+        return not nfa_states.isdisjoint(self.nfa.accept_states)
+
+    def _step(self, nfa_states: Iterable[int], symbol_class: int) -> Set[int]:
+        # run one step of the subset construction, any character of the class will do
+        next_set = set()
+        if symbol_class != NO_MATCH_CLASS:
+            symbol = self.alphabet.representative(symbol_class)
+            transitions = self.nfa.transitions
+            class_transitions = self._class_transitions
+            for nfa_state in nfa_states:
+                if nfa_state in transitions and symbol in transitions[nfa_state]:
+                    next_set.update(transitions[nfa_state][symbol])
+                if nfa_state in class_transitions:
+                    for char_class, destinations in class_transitions[nfa_state]:
+                        if symbol in char_class:
+                            next_set.update(destinations)
+        return next_set
+
+    def _add_state(self, nfa_states: FrozenSet[int]) -> int:
+        state = len(self._state_sets)
+        self._state_sets.append(nfa_states)
+        self._state_ids[nfa_states] = state
+        self._results.append('Y' if self._is_accepting(nfa_states) else 'N')
+        self._table.append([UNKNOWN_TRANSITION] * self.alphabet.class_count)
+        return state
+
+    def __len__(self) -> int:
+        return len(self._state_sets)
+
+
+def determinize(nfa: NFA, max_states: int = DEFAULT_MAX_DFA_STATES) -> NFA:
+    """
+    Converts an epsilon-free NFA into an equivalent DFA using subset construction.
+    The DFA is partial: transitions into the empty set of states are left out.
+    :param nfa: epsilon-free NFA
+    :param max_states: maximum number of DFA states, DFAStateLimitError is raised if there are more
+    :return: DFA in the NFA representation, with states 0..n-1 and start state 0
+    """
+    # the alphabet of the DFA are disjoint character ranges, so overlapping labels like 'a' and [a-z]
+    # become 'a' and [b-z]. without character classes these are just the single characters
+    ranges = split_ranges(_alphabet(nfa))
+    range_starts = [first for first, _ in ranges]
+    alphabet = [range_label(first, last) for first, last in ranges]
+
+    # NFA state -> {index into alphabet: destinations}
+    range_transitions: Dict[int, Dict[int, Set[int]]] = {}
+    for state, state_transitions in nfa.transitions.items():
+        state_ranges: Dict[int, Set[int]] = {}
+        range_transitions[state] = state_ranges
+        for label, destinations in state_transitions.items():
+            for first, last in label_ranges(label):
+                # the label is exactly the union of the ranges between its first and last character
+                index = bisect_left(range_starts, first)
+                while index < len(ranges) and ranges[index][1] <= last:
+                    state_ranges.setdefault(index, set()).update(destinations)
+                    index += 1
+
+    start_set = frozenset([nfa.start_state])
+    state_ids: Dict[FrozenSet[int], int] = {start_set: 0}
+    queue = deque([start_set])
+
+    transitions: Dict[int, Dict[str, Set[int]]] = {}
+    accept_states: Set[int] = set()
+
+    while queue:
+        current_set = queue.popleft()
+        current = state_ids[current_set]
+        if not current_set.isdisjoint(nfa.accept_states):
+            accept_states.add(current)
+
+        moves: Dict[int, Set[int]] = {}
+        for state in current_set:
+            for index, destinations in range_transitions.get(state, {}).items():
+                moves.setdefault(index, set()).update(destinations)
+
+        for index in sorted(moves):
+            next_set = frozenset(moves[index])
+            if next_set not in state_ids:
+                if len(state_ids) >= max_states:
+                    raise DFAStateLimitError(f"Subset construction exceeded the limit of {max_states} DFA states")
+                state_ids[next_set] = len(state_ids)
+                queue.append(next_set)
+
+            transitions.setdefault(current, {})[alphabet[index]] = {state_ids[next_set]}
+
+    return NFA(list(range(len(state_ids))), set(alphabet), transitions, 0, accept_states)
+
+
+def minimize(dfa: NFA) -> NFA:
+    """
+    Minimizes a (partial) DFA with Hopcroft's partition refinement.
+    States that can not reach an accepting state are dropped together with their transitions.
+    :param dfa: DFA in the NFA representation, as returned by determinize
+    :return: minimal DFA with states 0..n-1 and start state 0
+    """
+    alphabet = sorted(_alphabet(dfa), key=label_sort_key)
+    states = list(dfa.states)
+
+    # missing transitions go to an extra dead state, which makes the DFA complete
+    dead = max(states, default=-1) + 1
+    all_states = states + [dead]
+
+    # inverse transitions: {symbol: {destination: [sources]}}
+    inverse: Dict[str, Dict[int, List[int]]] = {symbol: {} for symbol in alphabet}
+    for state in all_states:
+        state_transitions = dfa.transitions.get(state, {})
+        for symbol in alphabet:
+            if symbol in state_transitions:
+                if len(state_transitions[symbol]) != 1:
+                    raise RuntimeError("Hopcroft minimization requires a deterministic automaton")
+                (destination,) = state_transitions[symbol]
+            else:
+                destination = dead
+            inverse[symbol].setdefault(destination, []).append(state)
+
+    # initial partition: accepting and non-accepting states
+    accepting = [state for state in states if state in dfa.accept_states]
+    rejecting = [state for state in all_states if state not in dfa.accept_states]
+    blocks: List[Set[int]] = [set(block) for block in (accepting, rejecting) if block]
+    block_of: Dict[int, int] = {}
+    for index, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = index
+
+    # it is enough to start with the smaller of the two blocks
+    waiting: Set[int] = {min(range(len(blocks)), key=lambda index: len(blocks[index]))}
+
+    while waiting:
+        # take a snapshot, the block itself may be split while it is processed
+        splitter = list(blocks[waiting.pop()])
+        for symbol in alphabet:
+            # group the predecessors of the splitter by the block they belong to
+            touched: Dict[int, Set[int]] = {}
+            for state in splitter:
+                for source in inverse[symbol].get(state, ()):
+                    touched.setdefault(block_of[source], set()).add(source)
+
+            for index, inside in touched.items():
+                block = blocks[index]
+                if len(inside) == len(block):
+                    continue
+
+                # split the block, the old index keeps the states outside of the preimage
+                block.difference_update(inside)
+                new_index = len(blocks)
+                blocks.append(inside)
+                for state in inside:
+                    block_of[state] = new_index
+
+                if index in waiting or len(inside) <= len(block):
+                    waiting.add(new_index)
+                else:
+                    waiting.add(index)
+
+    # renumber the blocks in BFS order from the start state, the dead block is dropped
+    dead_block = block_of[dead]
+    start_block = block_of[dfa.start_state]
+    if start_block == dead_block:
+        return NFA([0], set(alphabet), {}, 0, set())
+
+    block_ids: Dict[int, int] = {start_block: 0}
+    queue = deque([start_block])
+    transitions: Dict[int, Dict[str, Set[int]]] = {}
+    accept_states: Set[int] = set()
+
+    while queue:
+        block = queue.popleft()
+        representative = next(iter(blocks[block]))
+        if representative in dfa.accept_states:
+            accept_states.add(block_ids[block])
+
+        for symbol, destinations in dfa.transitions.get(representative, {}).items():
+            destination_block = block_of[next(iter(destinations))]
+            if destination_block == dead_block:
+                continue
+            if destination_block not in block_ids:
+                block_ids[destination_block] = len(block_ids)
+                queue.append(destination_block)
+            transitions.setdefault(block_ids[block], {})[symbol] = {block_ids[destination_block]}
+
+    return NFA(list(range(len(block_ids))), set(alphabet), transitions, 0, accept_states)
+
+
+def _alphabet(nfa: NFA) -> set:
+    symbols = set()
+    for state in nfa.transitions:
+        symbols.update(nfa.transitions[state])
+    if EPSILON in symbols:
+        raise RuntimeError("Automaton must not contain epsilon transitions")
+    return symbols
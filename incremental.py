@@ -0,0 +1,84 @@
+from typing import FrozenSet
+
+import build
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+
+# resumable state of a Matcher: the set of active NFA states, shared with the lazy DFA cache
+Checkpoint = FrozenSet[int]
+
+
+class Matcher:
+    __slots__ = ('lazy_dfa', '_key', '_accepting')
+
+    def __init__(self, lazy_dfa: LazyDFA) -> None:
+        """
+        Simulates an input that arrives in chunks, without buffering it or starting over for every chunk.
+        Matchers only hold a reference to a set of NFA states, so any number of them, one per stream,
+        can share a lazy DFA and its cache of computed transitions. Matchers sharing a DFA must be fed
+        from the same thread.
+
+        :param lazy_dfa: lazy DFA of the automaton, for example from compile_matcher(...).lazy_dfa
+        """
+        self.lazy_dfa = lazy_dfa
+
+        # state ids are invalidated when the cache is flushed, so the set of NFA states is kept instead.
+        # it is the key of the state in the cache, turning it back into an id is a single lookup
+        self._key: Checkpoint = lazy_dfa.state_key(lazy_dfa.start)
+        self._accepting = lazy_dfa.is_accepting(lazy_dfa.start)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Simulates the next part of the input.
+        :return: True if the input so far is accepted, same as is_accepting
+        """
+        lazy_dfa = self.lazy_dfa
+        state = lazy_dfa.advance(chunk, lazy_dfa.state_id(self._key))
+        self._key = lazy_dfa.state_key(state)
+        self._accepting = lazy_dfa.is_accepting(state)
+        return self._accepting
+
+    def feed_results(self, chunk: str) -> str:
+        """
+        Same as feed, but returns 'Y'/'N' for every prefix of the input ending in the chunk, like run.simulate.
+        """
+        lazy_dfa = self.lazy_dfa
+        result, state = lazy_dfa.run(chunk, lazy_dfa.state_id(self._key))
+        self._key = lazy_dfa.state_key(state)
+        self._accepting = lazy_dfa.is_accepting(state)
+        return result
+
+    def is_accepting(self) -> bool:
+        return self._accepting
+
+    def snapshot(self) -> Checkpoint:
+        """
+        Returns the state of the simulation. It is immutable and usually shared with the cache,
+        so keeping a checkpoint costs a single reference.
+        """
+        return self._key
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """
+        Continues the simulation from a checkpoint of this matcher or of another one with the same lazy DFA.
+        """
+        self._key = checkpoint
+        self._accepting = self.lazy_dfa.is_accepting(self.lazy_dfa.state_id(checkpoint))
+
+    def reset(self) -> None:
+        """
+        Starts over with an empty input.
+        """
+        self.restore(self.lazy_dfa.state_key(self.lazy_dfa.start))
+
+    def copy(self) -> 'Matcher':
+        matcher = Matcher(self.lazy_dfa)
+        matcher.restore(self._key)
+        return matcher
+
+
+def compile_matcher(regex: str, cache_size: int = DEFAULT_CACHE_SIZE) -> Matcher:
+    """
+    Compiles the regular expression and returns a matcher at the start of the input.
+    More matchers for other streams are created with Matcher(matcher.lazy_dfa) or copy().
+    """
+    return Matcher(LazyDFA(build.compile_regex(regex), cache_size))
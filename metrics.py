@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Optional, Union
+
+from automaton import NFA
+
+Number = Union[int, float]
+
+
+class Metrics:
+    def __init__(self, callback: Optional[Callable[[str, float], None]] = None) -> None:
+        """
+        Collects the time spent in every phase of building and simulating automata, together with counters
+        like automaton sizes and cache hits. Functions take an optional metrics object and skip all
+        bookkeeping if none is given.
+
+        :param callback: called with the name and duration in seconds of every phase when it ends
+        """
+        self.callback = callback
+
+        # phase name -> total seconds, in the order the phases first ran
+        self.timings: Dict[str, float] = {}
+
+        # counter name -> value, names are dotted like 'reduce.states'
+        self.counters: Dict[str, Number] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            if self.callback is not None:
+                self.callback(name, seconds)
+
+    def count(self, name: str, value: Number = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: Number) -> None:
+        self.counters[name] = value
+
+    def peak(self, name: str, value: Number) -> None:
+        if value > self.counters.get(name, value - 1):
+            self.counters[name] = value
+
+    def update(self, prefix: str, values: Dict[str, Number]) -> None:
+        """
+        Stores a dictionary of statistics, like AutomatonCache.stats(), under the prefix.
+        """
+        for name, value in values.items():
+            self.counters[f"{prefix}.{name}"] = value
+
+    def automaton(self, name: str, nfa: NFA) -> None:
+        """
+        Records the number of states and transitions of the automaton after the phase with the given name.
+        """
+        self.counters[f"{name}.states"] = len(nfa.states)
+        self.counters[f"{name}.transitions"] = sum(len(destinations) for state_transitions in nfa.transitions.values()
+                                                   for destinations in state_transitions.values())
+
+    def as_dict(self) -> Dict[str, Dict[str, Number]]:
+        return {'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+    def report(self) -> str:
+        lines = [f"{name:32} {seconds * 1000:12.3f} ms" for name, seconds in self.timings.items()]
+        for name, value in self.counters.items():
+            lines.append(f"{name:32} {value:12.4f}" if isinstance(value, float) else f"{name:32} {value:12}")
+        return '\n'.join(lines)
+
+
+class _DisabledMetrics(Metrics):
+    """
+    Metrics that record nothing, used when no metrics object is given so callers need no checks.
+    """
+
+    def phase(self, name: str):
+        return nullcontext()
+
+    def count(self, name: str, value: Number = 1) -> None:
+        pass
+
+    def set(self, name: str, value: Number) -> None:
+        pass
+
+    def peak(self, name: str, value: Number) -> None:
+        pass
+
+    def update(self, prefix: str, values: Dict[str, Number]) -> None:
+        pass
+
+    def automaton(self, name: str, nfa: NFA) -> None:
+        pass
+
+
+DISABLED = _DisabledMetrics()
+
+
+def hit_rate(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
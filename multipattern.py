@@ -0,0 +1,176 @@
+import argparse
+import sys
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Sequence, Set, Tuple
+
+import build
+from automaton import NFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE, UNKNOWN_TRANSITION
+
+NO_MATCHES: FrozenSet[int] = frozenset()
+
+
+def combine(nfas: Sequence[NFA]) -> Tuple[NFA, Dict[int, FrozenSet[int]]]:
+    """
+    Combines epsilon-free NFAs into a single NFA accepting the union of their languages.
+    This is the alternation of the automata, but without epsilon transitions: the new start state 0 gets the
+    transitions of every start state, and the states of the i-th NFA are renumbered after those of the previous ones.
+    :param nfas: epsilon-free NFAs, for example from build.compile_regex
+    :return: the combined NFA and {accept state: ids of the NFAs (indexes in nfas) it accepts for}
+    """
+    start = 0
+    states: List[int] = [start]
+    transitions: Dict[int, Dict[str, Set[int]]] = {}
+    symbols = set()
+    accept_patterns: Dict[int, FrozenSet[int]] = {}
+    start_patterns: Set[int] = set()
+
+    for pattern, nfa in enumerate(nfas):
+        state_ids: Dict[int, int] = {state: len(states) + i for i, state in enumerate(nfa.states)}
+        states.extend(state_ids.values())
+        symbols.update(nfa.symbols)
+
+        for state, state_transitions in nfa.transitions.items():
+            transitions[state_ids[state]] = {symbol: {state_ids[destination] for destination in destinations}
+                                             for symbol, destinations in state_transitions.items()}
+
+        # the combined start state can do whatever the start state of every pattern can do
+        start_transitions = transitions.setdefault(start, {})
+        for symbol, destinations in transitions.get(state_ids[nfa.start_state], {}).items():
+            start_transitions.setdefault(symbol, set()).update(destinations)
+
+        for state in nfa.accept_states:
+            accept_patterns[state_ids[state]] = frozenset([pattern])
+        if nfa.start_state in nfa.accept_states:
+            start_patterns.add(pattern)
+
+    if start_patterns:
+        accept_patterns[start] = frozenset(start_patterns)
+    # without patterns the start state has no entry, otherwise no pattern may have a transition from its start state
+    if start in transitions and not transitions[start]:
+        del transitions[start]
+
+    return NFA(states, symbols, transitions, start, set(accept_patterns)), accept_patterns
+
+
+class MultiPatternDFA(LazyDFA):
+    def __init__(self, nfa: NFA, accept_patterns: Dict[int, FrozenSet[int]],
+                 cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Lazily built DFA of a combined NFA, which also knows the patterns every DFA state accepts.
+        A single pass over the input reports the matches of all patterns, so once the DFA states are cached
+        the cost per character does not depend on the number of patterns.
+
+        :param nfa: combined epsilon-free NFA, as returned by combine
+        :param accept_patterns: {accept state: pattern ids}, as returned by combine
+        :param cache_size: maximum number of DFA states kept in the cache before it is flushed
+        """
+        self.accept_patterns = accept_patterns
+
+        # DFA state id -> ids of the patterns that accept in it
+        self._matches: List[FrozenSet[int]] = []
+
+        super().__init__(nfa, cache_size)
+
+    def scan(self, input_string: str) -> Iterator[Tuple[int, FrozenSet[int]]]:
+        """
+        Simulates the input string and yields (i, pattern ids) for every prefix input_string[:i + 1]
+        that is accepted by at least one pattern.
+        """
+        for position, matches in enumerate(self._run_matches(input_string, self.start)):
+            if matches:
+                yield position, matches
+
+    def match_positions(self, input_string: str) -> List[FrozenSet[int]]:
+        """
+        Returns the ids of the patterns accepting input_string[:i + 1] for every position i.
+        """
+        return list(self._run_matches(input_string, self.start))
+
+    def fullmatch(self, input_string: str) -> FrozenSet[int]:
+        """
+        Returns the ids of the patterns accepting the whole input string.
+        """
+        matches = self._matches[self.start]
+        for matches in self._run_matches(input_string, self.start):
+            pass
+        return matches
+
+    def matched_patterns(self, input_string: str) -> Set[int]:
+        """
+        Returns the ids of the patterns accepting at least one non-empty prefix of the input string.
+        """
+        result: Set[int] = set()
+        for _, matches in self.scan(input_string):
+            result.update(matches)
+        return result
+
+    def flush(self) -> None:
+        self._matches.clear()
+        super().flush()
+
+    def _run_matches(self, input_string: str, state: int) -> Iterator[FrozenSet[int]]:
+        # same loop as LazyDFA.run, but yields the accepted patterns after every character
+        table = self._table
+        matches = self._matches
+        for symbol_class in self.alphabet.translate(input_string):
+            next_state = table[state][symbol_class]
+            if next_state == UNKNOWN_TRANSITION:
+                next_state = self._compute_transition(state, symbol_class)
+            state = next_state
+            yield matches[state]
+
+    def _add_state(self, nfa_states: FrozenSet[int]) -> int:
+        patterns: Set[int] = set()
+        for nfa_state in nfa_states:
+            if nfa_state in self.accept_patterns:
+                patterns.update(self.accept_patterns[nfa_state])
+        self._matches.append(frozenset(patterns) if patterns else NO_MATCHES)
+        return super()._add_state(nfa_states)
+
+
+def compile_patterns(regexes: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE) -> MultiPatternDFA:
+    """
+    Compiles the regular expressions into one automaton, pattern ids are the indexes in regexes.
+    """
+    nfa, accept_patterns = combine([build.compile_regex(regex) for regex in regexes])
+    return MultiPatternDFA(nfa, accept_patterns, cache_size)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compiles many regular expressions into one automaton and prints, "
+                                                 "for every input line, the ids of the patterns matching it")
+    parser.add_argument('patterns', help="file with one regular expression per line, ids are line numbers from 0")
+    parser.add_argument('input', nargs='?', help="file with one input string per line, stdin if omitted")
+    parser.add_argument('--prefixes', action='store_true',
+                        help="print patterns matching any prefix of the line instead of the whole line")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached DFA states")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with open(args.patterns, 'r') as patterns_file:
+        regexes = [line.rstrip('\n') for line in patterns_file]
+
+    nfas: List[NFA] = []
+    for pattern, regex in enumerate(regexes):
+        try:
+            nfas.append(build.compile_regex(regex))
+        except build.RegexSyntaxError as error:
+            sys.exit(f"error: pattern {pattern}: {error}\n{regex}\n{' ' * error.position}^")
+    multi_dfa = MultiPatternDFA(*combine(nfas), args.cache_size)
+
+    input_file = sys.stdin if args.input is None else open(args.input, 'r')
+    with input_file:
+        for line in input_file:
+            input_string = line.rstrip('\n')
+            if args.prefixes:
+                patterns = multi_dfa.matched_patterns(input_string)
+            else:
+                patterns = multi_dfa.fullmatch(input_string)
+            sys.stdout.write(' '.join(map(str, sorted(patterns))) + '\n')
+
+
+if __name__ == '__main__':
+    main()
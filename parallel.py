@@ -0,0 +1,111 @@
+import os
+import pickle
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from automaton import NFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+
+DEFAULT_CHUNK_SIZE = 10000  # input strings per task
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024  # bytes of an input file per task
+PENDING_TASKS_PER_WORKER = 2  # tasks submitted ahead per worker, bounds memory of pending results
+
+# automaton of the current worker process, set by the pool initializer
+_worker_dfa: Optional[LazyDFA] = None
+
+
+def _init_worker(serialized_nfa: bytes, cache_size: int) -> None:
+    global _worker_dfa
+    _worker_dfa = LazyDFA(pickle.loads(serialized_nfa), cache_size)
+
+
+def _match_chunk(inputs: List[str]) -> List[str]:
+    return [_worker_dfa.simulate(input_string) for input_string in inputs]
+
+
+def _match_file_range(path: str, start: int, end: int) -> str:
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+
+    # line breaks are translated like in text mode, so results match reading the file serially
+    lines = data.decode().replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    # the range ends with a line break unless it is the end of a file without a trailing line break
+    if lines[-1] == '':
+        lines.pop()
+    return ''.join(_worker_dfa.simulate(line) + '\n' for line in lines)
+
+
+def _create_pool(nfa: NFA, workers: Optional[int], cache_size: int) -> ProcessPoolExecutor:
+    # the automaton is serialized once and every worker deserializes it in its initializer
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(pickle.dumps(nfa), cache_size))
+
+
+def _ordered_results(pool: ProcessPoolExecutor, tasks: Iterable[Tuple], max_pending: int) -> Iterator:
+    # submits tasks ahead, at most max_pending at a time, and yields their results in submission order
+    pending: Deque[Future] = deque()
+    for task in tasks:
+        pending.append(pool.submit(*task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def match_parallel(nfa: NFA, inputs: Iterable[str], workers: Optional[int] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE, cache_size: int = DEFAULT_CACHE_SIZE) -> Iterator[str]:
+    """
+    Same as batch.match_many, but simulates chunks of inputs in a pool of worker processes.
+    Results are yielded in the order of inputs, only a bounded number of chunks is in flight.
+    :param nfa: epsilon-free NFA
+    :param inputs: iterable of input strings, consumed lazily
+    :param workers: number of worker processes, number of CPUs if None
+    :param chunk_size: number of input strings sent to a worker at once
+    :param cache_size: maximum number of cached DFA states in every worker
+    :return: generator of results, in the order of inputs
+    """
+    workers = workers or os.cpu_count() or 1
+    iterator = iter(inputs)
+    chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+
+    with _create_pool(nfa, workers, cache_size) as pool:
+        tasks = ((_match_chunk, chunk) for chunk in chunks)
+        for results in _ordered_results(pool, tasks, workers * PENDING_TASKS_PER_WORKER):
+            yield from results
+
+
+def file_ranges(path: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Splits the file into byte ranges of roughly chunk_bytes bytes that start and end on line boundaries.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as input_file:
+        while boundaries[-1] < size:
+            input_file.seek(boundaries[-1] + chunk_bytes)
+            # move to the start of the next line
+            input_file.readline()
+            boundaries.append(min(input_file.tell(), size))
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def match_file_parallel(nfa: NFA, path: str, workers: Optional[int] = None,
+                        chunk_bytes: int = DEFAULT_CHUNK_BYTES, cache_size: int = DEFAULT_CACHE_SIZE) -> Iterator[str]:
+    """
+    Simulates every line of a file in a pool of worker processes. Workers read their byte ranges
+    of the file themselves, so the input is never sent through the parent process.
+    :param nfa: epsilon-free NFA
+    :param path: path of a file with one input string per line
+    :param workers: number of worker processes, number of CPUs if None
+    :param chunk_bytes: approximate number of bytes of the file handled by a single task
+    :param cache_size: maximum number of cached DFA states in every worker
+    :return: generator of blocks of result lines (each ending with a line break), in the order of the file
+    """
+    workers = workers or os.cpu_count() or 1
+
+    with _create_pool(nfa, workers, cache_size) as pool:
+        tasks = ((_match_file_range, path, start, end) for start, end in file_ranges(path, chunk_bytes))
+        yield from _ordered_results(pool, tasks, workers * PENDING_TASKS_PER_WORKER)
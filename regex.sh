@@ -1,12 +1,5 @@
 #!/bin/bash
 
-# Extract the arguments from command-line
-arg1=$1
-arg2=$2
-
-# Build the regular expression using the Python script
-regex=$(echo "$arg2" | python build.py)
-
-# Run the Python script with the input string
-echo "$arg1" | python run.py <<< "$(echo -e "${arg1}\n${regex}")"
-
+# Simulates the string (first argument) on the regular expression (second argument).
+# Uses the server started with 'python server.py --socket' if it is running, compiles in-process otherwise.
+python "$(dirname "$0")/client.py" -- "$1" "$2"
@@ -1,10 +1,28 @@
+import argparse
+import sys
+
 from automaton import NFA
-from typing import Set, Dict
+from charclass import parse_label
+from bitparallel import BitParallelNFA
+from compact import CompactNFA
+import serialization
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+from metrics import DISABLED, Metrics
+from typing import Optional, Set, Dict, TextIO
+
+# what _simulate returns: 'Y'/'N' for every prefix, whether the whole input is accepted,
+# or the index of the first accepted prefix
+FULL_OUTPUT = 0
+ACCEPTS = 1
+FIRST_MATCH = 2
 
 
-def read_nfa() -> NFA:
+def read_nfa(input_file: Optional[TextIO] = None) -> NFA:
+    # the NFA is read from stdin unless another text stream is given
+    input_file = input_file or sys.stdin
+
     # read the number of states, the number of accept states, and the number of transitions
-    input_list = input().split()
+    input_list = input_file.readline().split()
     state_count: int = int(input_list[0])
     accept_count: int = int(input_list[1])
     transition_count: int = int(input_list[2])
@@ -13,15 +31,16 @@ def read_nfa() -> NFA:
     states: list[int] = list(range(state_count))
 
     # read the accept states
-    input_list = input().split()
+    input_list = input_file.readline().split()
     accept_states: set[int] = set()
     for i in range(accept_count):
         accept_states.add(int(input_list[i]))
 
-    # read transitions
+    # read transitions, the alphabet is collected from their labels
     transitions: Dict[int, Dict[str, Set[int]]] = {}
+    symbols: set = set()
     for i in range(state_count):
-        input_list = input().split()
+        input_list = input_file.readline().split()
 
         # read the number of transitions for this state
         state_transitions_count: int = int(input_list[0])
@@ -35,10 +54,11 @@ def read_nfa() -> NFA:
 
         # read the transitions for this state
         for j in range(state_transitions_count):
-            symbol: str = input_list[j * 2 + 1]
+            symbol = parse_label(input_list[j * 2 + 1])
             transition_state: int = int(input_list[(j + 1) * 2])
 
             # add the transition to the dictionary
+            symbols.add(symbol)
             if symbol not in transitions[i]:
                 transitions[i][symbol] = set()
             transitions[i][symbol].add(transition_state)
@@ -47,15 +67,61 @@ def read_nfa() -> NFA:
     assert transition_count == 0
 
     # create and return an NFA object
-    return NFA(states, set(), transitions, 0, accept_states)
+    return NFA(states, symbols, transitions, 0, accept_states)
+
+
+def simulate(input_string: str, nfa: NFA, metrics: Optional[Metrics] = None) -> str:
+    with (metrics or DISABLED).phase('simulate'):
+        if isinstance(nfa, CompactNFA):
+            return nfa.simulate(input_string)
+        return _simulate(input_string, nfa, metrics, FULL_OUTPUT)
+
+
+def accepts(input_string: str, nfa: NFA) -> bool:
+    """
+    Returns True if the NFA accepts the whole input string, the last character of simulate.
+    Returns as soon as the result is known, without reading the rest of the input.
+    """
+    if isinstance(nfa, CompactNFA):
+        return nfa.simulate(input_string).endswith('Y')
+    return _simulate(input_string, nfa, None, ACCEPTS)
+
 
+def first_match(input_string: str, nfa: NFA) -> int:
+    """
+    Returns the smallest i such that the NFA accepts input_string[:i + 1], the index of the first 'Y' of simulate,
+    or -1 if there is none. Returns as soon as the result is known.
+    """
+    if isinstance(nfa, CompactNFA):
+        return nfa.simulate(input_string).find('Y')
+    return _simulate(input_string, nfa, None, FIRST_MATCH)
 
-def simulate(input_string: str, nfa: NFA) -> str:
-    result: str = ''
+
+def _simulate(input_string: str, nfa: NFA, metrics: Optional[Metrics], mode: int):
+    result: list[str] = []
     current_states = {nfa.start_state}
 
+    # transitions labeled with character classes can not be looked up by the character. states that can not
+    # lead to acceptance are dropped: once no state is left, no prefix can be accepted anymore, and once
+    # an accept-absorbing state is active, every prefix is accepted. all of them are analysed once per automaton
+    tables = nfa.simulation_tables()
+    class_transitions = tables.class_transitions
+    live_states = tables.live_states
+    absorbing_states = tables.absorbing_states
+    current_states &= live_states
+
+    # reduced NFAs have no dead states, there is nothing to drop after every step
+    has_dead_states = tables.has_dead_states
+
+    # the largest set of active states is only tracked when metrics are collected
+    track_peak = metrics is not None
+    peak = len(current_states)
+
+    # characters whose result is filled in without simulating them
+    skipped = 0
+
     # loop over the input string
-    for ch in input_string:
+    for position, ch in enumerate(input_string):
         next_states = set()
 
         # for each current state, find the set of states that can be reached by consuming the input character
@@ -63,29 +129,135 @@ def simulate(input_string: str, nfa: NFA) -> str:
             if state in nfa.transitions:
                 if ch in nfa.transitions[state]:
                     next_states.update(nfa.transitions[state][ch])
+            if state in class_transitions:
+                for char_class, destinations in class_transitions[state]:
+                    if ch in char_class:
+                        next_states.update(destinations)
 
         # set the next set of current states to the set of reachable states
+        if has_dead_states:
+            next_states &= live_states
         current_states = next_states
+        if track_peak and len(current_states) > peak:
+            peak = len(current_states)
 
-        # check if any of the current states are accepting states
+        # check if any of the current states are accepting states, the rest of the result is known
+        # if an accept-absorbing state is active or no state is left
         if current_states.intersection(nfa.accept_states):
-            result += 'Y'
+            if mode == FIRST_MATCH:
+                return position
+            result.append('Y')
+            if absorbing_states and not current_states.isdisjoint(absorbing_states):
+                if mode == ACCEPTS:
+                    return True
+                skipped = len(input_string) - position - 1
+                result.append('Y' * skipped)
+                break
         else:
-            result += 'N'
+            result.append('N')
+            if not current_states:
+                if mode != FULL_OUTPUT:
+                    return False if mode == ACCEPTS else -1
+                skipped = len(input_string) - position - 1
+                result.append('N' * skipped)
+                break
+
+    if mode == ACCEPTS:
+        return not current_states.isdisjoint(nfa.accept_states)
+    if mode == FIRST_MATCH:
+        return -1
+
+    if metrics is not None:
+        metrics.count('simulate.characters', len(input_string))
+        metrics.count('simulate.skipped_characters', skipped)
+        metrics.peak('simulate.peak_active_states', peak)
 
     # return the result string
+    return ''.join(result)
+
+
+def simulate_lazy(input_string: str, nfa: NFA, cache_size: int = DEFAULT_CACHE_SIZE,
+                  metrics: Optional[Metrics] = None) -> str:
+    """
+    Same as simulate, but builds DFA states on demand and reuses the cached transitions.
+    """
+    metrics = metrics or DISABLED
+    with metrics.phase('simulate_lazy'):
+        lazy_dfa = LazyDFA(nfa, cache_size)
+        result = lazy_dfa.simulate(input_string)
+    metrics.update('lazy_dfa', lazy_dfa.stats())
     return result
 
 
+def simulate_bitparallel(input_string: str, nfa: NFA, metrics: Optional[Metrics] = None) -> str:
+    """
+    Same as simulate, but keeps the set of active states as a single integer bitmask.
+    """
+    with (metrics or DISABLED).phase('simulate_bitparallel'):
+        return BitParallelNFA(nfa).simulate(input_string)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulates a string on an NFA generated by build.py")
+    parser.add_argument('--engine', choices=['nfa', 'lazy', 'compact', 'bits'], default='nfa',
+                        help="simulation engine: plain NFA simulation, lazily built DFA, array-backed NFA "
+                             "or bit-parallel NFA simulation")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached DFA states for the lazy engine")
+    parser.add_argument('--format', choices=['text', 'binary'], default='text',
+                        help="format of the automaton, see serialization.py for the binary format")
+    parser.add_argument('--nfa', help="file with the automaton, otherwise it is read from stdin after the input string")
+    parser.add_argument('--stats', action='store_true',
+                        help="print the time spent reading and simulating, and simulation statistics to stderr")
+    return parser.parse_args()
+
+
+def read_input(args: argparse.Namespace) -> tuple:
+    # returns the automaton and the input string, in the order given by the command line arguments
+    if args.format == 'binary':
+        input_string: str = sys.stdin.buffer.readline().decode().rstrip('\n')
+        if args.nfa is None:
+            compact_nfa: CompactNFA = serialization.read_binary(sys.stdin.buffer)
+        else:
+            compact_nfa: CompactNFA = serialization.load_file(args.nfa)
+
+        # the compact form is simulated directly, other engines need the dictionary representation
+        nfa = compact_nfa if args.engine in ('nfa', 'compact') else compact_nfa.to_nfa()
+    else:
+        input_string: str = input()
+        if args.nfa is None:
+            nfa: NFA = read_nfa()
+        else:
+            with open(args.nfa, 'r') as nfa_file:
+                nfa: NFA = read_nfa(nfa_file)
+    return nfa, input_string
+
+
 def main():
+    args = parse_args()
+    metrics = Metrics() if args.stats else None
+
     # read the input string and the NFA definition, and simulate the input string on the NFA
-    input_string: str = input()
-    nfa: NFA = read_nfa()
-    result: str = simulate(input_string, nfa)
+    with (metrics or DISABLED).phase('read'):
+        nfa, input_string = read_input(args)
+
+    if isinstance(nfa, CompactNFA):
+        result: str = simulate(input_string, nfa, metrics)
+    elif args.engine == 'lazy':
+        result: str = simulate_lazy(input_string, nfa, args.cache_size, metrics)
+    elif args.engine == 'compact':
+        result: str = simulate(input_string, CompactNFA.from_nfa(nfa), metrics)
+    elif args.engine == 'bits':
+        result: str = simulate_bitparallel(input_string, nfa, metrics)
+    else:
+        result: str = simulate(input_string, nfa, metrics)
 
     # print the result
     print(result)
 
+    if metrics is not None:
+        print(metrics.report(), file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
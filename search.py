@@ -0,0 +1,201 @@
+import argparse
+import sys
+from itertools import islice
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+import build
+from automaton import NFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE, UNKNOWN_TRANSITION
+
+# state of the search DFA: groups of NFA states ordered by the position the threads in them started at,
+# and whether a match has been seen already
+SearchState = Tuple[Tuple[FrozenSet[int], ...], bool]
+
+
+def reverse_nfa(nfa: NFA) -> NFA:
+    """
+    Returns an epsilon-free NFA accepting the reversed strings of the language of the epsilon-free NFA.
+    All transitions are reversed, a new start state gets the reversed transitions of every accept state,
+    and the old start state becomes the accept state.
+    """
+    start = max(nfa.states, default=-1) + 1
+    transitions: Dict[int, Dict[str, Set[int]]] = {}
+    for state, state_transitions in nfa.transitions.items():
+        for symbol, destinations in state_transitions.items():
+            for destination in destinations:
+                transitions.setdefault(destination, {}).setdefault(symbol, set()).add(state)
+
+    start_transitions: Dict[str, Set[int]] = {}
+    for state in nfa.accept_states:
+        for symbol, sources in transitions.get(state, {}).items():
+            start_transitions.setdefault(symbol, set()).update(sources)
+    if start_transitions:
+        transitions[start] = start_transitions
+
+    accept_states = {nfa.start_state}
+    if nfa.start_state in nfa.accept_states:
+        accept_states.add(start)
+    return NFA(list(nfa.states) + [start], set(nfa.symbols), transitions, start, accept_states)
+
+
+class SearchDFA(LazyDFA):
+    def __init__(self, nfa: NFA, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Lazily built DFA finding the end of the leftmost-longest match of an epsilon-free NFA.
+
+        The search is unanchored, as if the start state had a self-loop on every character: after every
+        character a new thread is started in the start state. Threads are kept in groups ordered by the position
+        they started at, so the DFA knows which match is leftmost without storing positions. A state reached by
+        an earlier group is dropped from the later ones, once a group accepts the later groups are dropped and no
+        new threads are started, and the DFA dies when the remaining groups can not continue.
+        """
+        # DFA state id -> True if no thread is left and the search is over
+        self._dead: List[bool] = []
+
+        super().__init__(nfa, cache_size)
+
+    def match_end(self, symbol_classes: memoryview, position: int) -> Optional[int]:
+        """
+        Returns the end of the leftmost-longest match starting at or after the position, None if there is none.
+        :param symbol_classes: the input translated by self.alphabet.translate, as a memoryview so that
+            the search can start in the middle without copying
+        :param position: index in the input the search starts at
+        """
+        table = self._table
+        results = self._results
+        dead = self._dead
+
+        state = self.start
+        end = position if results[state] == 'Y' else None
+        index = position
+        for symbol_class in symbol_classes[position:]:
+            index += 1
+            next_state = table[state][symbol_class]
+            if next_state == UNKNOWN_TRANSITION:
+                next_state = self._compute_transition(state, symbol_class)
+            state = next_state
+            if dead[state]:
+                break
+            if results[state] == 'Y':
+                end = index
+        return end
+
+    def flush(self) -> None:
+        self._dead.clear()
+        super().flush()
+
+    def _initial_set(self) -> SearchState:
+        start = self.nfa.start_state
+        return (frozenset([start]),), start in self.nfa.accept_states
+
+    def _successors(self, search_state: SearchState, symbol_class: int) -> SearchState:
+        groups, matched = search_state
+        accept_states = self.nfa.accept_states
+
+        seen: Set[int] = set()
+        next_groups: List[FrozenSet[int]] = []
+        for group in groups:
+            next_group = self._step(group, symbol_class)
+            next_group.difference_update(seen)
+            if not next_group:
+                continue
+            seen.update(next_group)
+            next_groups.append(frozenset(next_group))
+            if not next_group.isdisjoint(accept_states):
+                # this group has the leftmost match, threads that started later can only give matches to the right
+                matched = True
+                break
+
+        if not matched and self.nfa.start_state not in seen:
+            # the self-loop of the start state starts a new thread after every character
+            next_groups.append(frozenset([self.nfa.start_state]))
+
+        return tuple(next_groups), matched
+
+    def _is_accepting(self, search_state: SearchState) -> bool:
+        accept_states = self.nfa.accept_states
+        return any(not group.isdisjoint(accept_states) for group in search_state[0])
+
+    def _add_state(self, search_state: SearchState) -> int:
+        groups, matched = search_state
+        self._dead.append(matched and not groups)
+        return super()._add_state(search_state)
+
+
+class Searcher:
+    def __init__(self, nfa: NFA, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Unanchored search for leftmost-longest matches of an epsilon-free NFA.
+        A forward search DFA finds where the match ends, and a DFA of the reversed NFA, run backwards
+        from that end, finds where it starts.
+
+        :param nfa: epsilon-free NFA
+        :param cache_size: maximum number of cached states of each of the two DFAs
+        """
+        self.nfa = nfa
+        self._forward = SearchDFA(nfa, cache_size)
+        self._reverse = LazyDFA(reverse_nfa(nfa), cache_size)
+
+    def find(self, input_string: str, position: int = 0) -> Optional[Tuple[int, int]]:
+        """
+        Returns (start, end) of the leftmost-longest match in input_string[position:], None if there is none.
+        """
+        return next(self.finditer(input_string, position), None)
+
+    def finditer(self, input_string: str, position: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, end) of all non-overlapping leftmost-longest matches, from left to right.
+        An empty match is followed by a search starting one character later, as in re.finditer.
+        """
+        symbol_classes = memoryview(self._forward.alphabet.translate(input_string))
+        while position <= len(input_string):
+            end = self._forward.match_end(symbol_classes, position)
+            if end is None:
+                return
+            start = self._match_start(input_string, position, end)
+            yield start, end
+            position = end if end > start else end + 1
+
+    def _match_start(self, input_string: str, position: int, end: int) -> int:
+        # the reversed NFA accepts input_string[start:end] read backwards, the longest such match gives the start
+        result, _ = self._reverse.run(input_string[position:end][::-1], self._reverse.start)
+        length = result.rfind('Y') + 1
+        return end - length
+
+
+def compile_searcher(regex: str, cache_size: int = DEFAULT_CACHE_SIZE) -> Searcher:
+    return Searcher(build.compile_regex(regex), cache_size)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Searches every line of the input for leftmost-longest matches "
+                                                 "of a regular expression and prints them")
+    parser.add_argument('regex', help="regular expression")
+    parser.add_argument('input', nargs='?', help="input file, stdin if omitted")
+    parser.add_argument('--first', action='store_true', help="print only the first match of every line")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached DFA states")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        searcher = compile_searcher(args.regex, args.cache_size)
+    except build.RegexSyntaxError as error:
+        sys.exit(f"error: {error}\n{args.regex}\n{' ' * error.position}^")
+
+    # one output line per match: line number, start and end offsets in the line, and the matched text
+    input_file = sys.stdin if args.input is None else open(args.input, 'r')
+    with input_file:
+        for line_number, line in enumerate(input_file, 1):
+            line = line.rstrip('\n')
+            matches = searcher.finditer(line)
+            if args.first:
+                matches = islice(matches, 1)
+            for start, end in matches:
+                sys.stdout.write(f"{line_number}:{start}:{end}:{line[start:end]}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import mmap
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Union
+
+from automaton import NFA
+from charclass import format_label, parse_label
+from compact import CompactNFA, states_to_mask
+
+BINARY_MAGIC = b'R2NB'
+BINARY_FORMAT_VERSION = 2
+
+# magic, version, state count, start state, accept state count, symbol count, transition count,
+# size of the symbol table in bytes. all numbers are little-endian
+HEADER = struct.Struct('<4sHxxIIIIII')
+
+# the binary format is:
+#   header
+#   symbol table: for every symbol its length as uint16 followed by the utf-8 bytes of its label in the text
+#                 format (character classes like [a-z]), padded to 4 bytes
+#   int32 state names[state count]
+#   int32 accept states[accept state count]
+#   int32 offsets[state count + 1]
+#   int32 labels[transition count]
+#   int32 targets[transition count]
+# the int32 arrays are the arrays of CompactNFA, so they can be used in place without copying
+
+
+def dumps(nfa: Union[NFA, CompactNFA]) -> bytes:
+    """
+    Serializes the NFA into the binary format.
+    """
+    compact_nfa = nfa if isinstance(nfa, CompactNFA) else CompactNFA.from_nfa(nfa)
+
+    symbol_table = bytearray()
+    for symbol in compact_nfa.symbols:
+        encoded = format_label(symbol).encode()
+        symbol_table += struct.pack('<H', len(encoded)) + encoded
+    symbol_table += bytes(-len(symbol_table) % 4)
+
+    accept_states = array('i', compact_nfa.accept_states())
+    int_arrays = (compact_nfa.state_names, accept_states, compact_nfa.offsets, compact_nfa.labels, compact_nfa.targets)
+
+    header = HEADER.pack(BINARY_MAGIC, BINARY_FORMAT_VERSION, len(compact_nfa), compact_nfa.start_state,
+                         len(accept_states), len(compact_nfa.symbols), len(compact_nfa.targets), len(symbol_table))
+
+    parts = [header, bytes(symbol_table)]
+    for int_array in int_arrays:
+        if sys.byteorder == 'little':
+            parts.append(bytes(int_array))
+        else:
+            swapped = array('i', int_array)
+            swapped.byteswap()
+            parts.append(swapped.tobytes())
+    return b''.join(parts)
+
+
+def loads(data) -> CompactNFA:
+    """
+    Loads an NFA from the binary format. On little-endian machines the arrays of the returned
+    CompactNFA are memoryviews of the data (bytes, bytearray, mmap, ...) and nothing is copied.
+    """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("Binary NFA is truncated")
+
+    magic, version, state_count, start_state, accept_count, symbol_count, transition_count, symbol_table_size = \
+        HEADER.unpack_from(view)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a binary NFA")
+    if version != BINARY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary NFA version {version}")
+
+    # read the symbol table
+    position = HEADER.size
+    symbols = []
+    for _ in range(symbol_count):
+        (length,) = struct.unpack_from('<H', view, position)
+        symbols.append(parse_label(bytes(view[position + 2:position + 2 + length]).decode()))
+        position += 2 + length
+    position = HEADER.size + symbol_table_size
+
+    arrays = []
+    for length in (state_count, accept_count, state_count + 1, transition_count, transition_count):
+        end = position + length * 4
+        if end > len(view):
+            raise ValueError("Binary NFA is truncated")
+        if sys.byteorder == 'little':
+            arrays.append(view[position:end].cast('i'))
+        else:
+            int_array = array('i', view[position:end].tobytes())
+            int_array.byteswap()
+            arrays.append(int_array)
+        position = end
+    state_names, accept_states, offsets, labels, targets = arrays
+
+    return CompactNFA(state_names, tuple(symbols), start_state, states_to_mask(accept_states), offsets, labels,
+                      targets)
+
+
+def write_binary(nfa: Union[NFA, CompactNFA], output: BinaryIO) -> None:
+    output.write(dumps(nfa))
+
+
+def read_binary(input_file: BinaryIO) -> CompactNFA:
+    return loads(input_file.read())
+
+
+def load_file(path: str) -> CompactNFA:
+    """
+    Memory-maps a binary NFA file, the automaton uses the mapped pages directly.
+    """
+    with open(path, 'rb') as input_file:
+        return loads(mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def is_binary(data: bytes) -> bool:
+    return data[:len(BINARY_MAGIC)] == BINARY_MAGIC
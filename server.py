@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import build
+from cache import AutomatonCache, DEFAULT_CACHE_ENTRIES, normalize_regex
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+from search import Searcher
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'regex2nfa.sock')
+MAX_REQUEST_BYTES = 64 * 1024 * 1024  # longest accepted request line
+
+# Protocol: every request and response is one JSON object on one line.
+#   {"id": 1, "op": "compile", "regex": "(ab|c)*d"}          -> {"id": 1, "result": {"states": 3}}
+#   {"id": 2, "op": "match", "regex": "...", "input": "abd"}  -> {"id": 2, "result": "NNY"}
+#   {"id": 3, "op": "match", "regex": "...", "inputs": [...]} -> {"id": 3, "result": ["NNY", ...]}
+#   {"id": 4, "op": "search", "regex": "...", "input": "..."} -> {"id": 4, "result": [[start, end], ...]}
+#   {"id": 5, "op": "stats"}                                  -> {"id": 5, "result": {"entries": 1, ...}}
+# The id is optional and copied to the response. Failed requests get {"id": ..., "error": message}, plus the
+# position for syntax errors in the regex.
+
+
+class RequestError(ValueError):
+    pass
+
+
+class RegexServer:
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES, cache_dir: Optional[str] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Keeps compiled automata resident between requests, so a request for a known regex only simulates the input.
+        Every regex gets one lazy DFA (and a searcher once it is searched), which keep their cached states
+        for later requests. The serve functions hand the requests to a single worker thread, so the automata are
+        never used concurrently while the event loop keeps reading and writing the other connections.
+
+        :param max_entries: maximum number of regexes kept compiled, the least recently used one is evicted
+        :param cache_dir: directory with compiled automata shared with other processes, see cache.AutomatonCache
+        :param cache_size: maximum number of cached states of every lazy DFA
+        """
+        self.cache_size = cache_size
+        self.automata = AutomatonCache(max_entries, cache_dir)
+
+        # normalized regex -> lazy DFA / searcher, evicted together with the automaton
+        self._dfas: OrderedDict[str, LazyDFA] = OrderedDict()
+        self._searchers: OrderedDict[str, Searcher] = OrderedDict()
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles a decoded request and returns the response, errors are reported in the response.
+        """
+        response: Dict[str, Any] = {}
+        if 'id' in request:
+            response['id'] = request['id']
+        try:
+            response['result'] = self._dispatch(request)
+        except build.RegexSyntaxError as error:
+            response['error'] = str(error)
+            response['position'] = error.position
+        except (ValueError, RuntimeError) as error:
+            response['error'] = str(error)
+        return response
+
+    def handle_line(self, line: bytes) -> bytes:
+        """
+        Handles one request line and returns the response line.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return _encode({'error': f"Invalid JSON: {error}"})
+        if not isinstance(request, dict):
+            return _encode({'error': "Request must be a JSON object"})
+        return _encode(self.handle(request))
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.automata.stats()
+        stats['lazy_dfas'] = len(self._dfas)
+        stats['searchers'] = len(self._searchers)
+        return stats
+
+    def _dispatch(self, request: Dict[str, Any]) -> Any:
+        op = request.get('op')
+        if op == 'stats':
+            return self.stats()
+        if op == 'compile':
+            return {'states': len(self.automata.get(_field(request, 'regex', str)).states)}
+        if op == 'match':
+            regex = _field(request, 'regex', str)
+            if 'inputs' in request:
+                inputs = _field(request, 'inputs', list)
+                if not all(isinstance(input_string, str) for input_string in inputs):
+                    raise RequestError("Field 'inputs' must be a list of strings")
+                lazy_dfa = self._lazy_dfa(regex)
+                return [lazy_dfa.simulate(input_string) for input_string in inputs]
+            input_string = _field(request, 'input', str)
+            return self._lazy_dfa(regex).simulate(input_string)
+        if op == 'search':
+            regex, input_string = _field(request, 'regex', str), _field(request, 'input', str)
+            return [list(span) for span in self._searcher(regex).finditer(input_string)]
+        raise RequestError(f"Unknown operation {op!r}")
+
+    def _lazy_dfa(self, regex: str) -> LazyDFA:
+        key = normalize_regex(regex)
+        lazy_dfa = self._dfas.get(key)
+        if lazy_dfa is None:
+            lazy_dfa = self._dfas[key] = LazyDFA(self.automata.get(key), self.cache_size)
+            self._evict(self._dfas)
+        else:
+            self._dfas.move_to_end(key)
+        return lazy_dfa
+
+    def _searcher(self, regex: str) -> Searcher:
+        key = normalize_regex(regex)
+        searcher = self._searchers.get(key)
+        if searcher is None:
+            searcher = self._searchers[key] = Searcher(self.automata.get(key), self.cache_size)
+            self._evict(self._searchers)
+        else:
+            self._searchers.move_to_end(key)
+        return searcher
+
+    def _evict(self, entries: OrderedDict) -> None:
+        if len(entries) > self.automata.max_entries:
+            entries.popitem(last=False)
+
+
+def _field(request: Dict[str, Any], name: str, field_type: type) -> Any:
+    value = request.get(name)
+    if not isinstance(value, field_type):
+        raise RequestError(f"Field {name!r} must be a {field_type.__name__}")
+    return value
+
+
+def _encode(response: Dict[str, Any]) -> bytes:
+    return json.dumps(response, ensure_ascii=False).encode() + b'\n'
+
+
+def _request_executor() -> ThreadPoolExecutor:
+    # one worker: the lazy DFAs and the LRU caches are not thread safe, and the simulation holds the GIL anyway.
+    # requests of all connections are queued for it, while the event loop accepts connections and moves bytes
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='regex2nfa')
+
+
+async def _serve_stream(server: RegexServer, executor: ThreadPoolExecutor, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter) -> None:
+    # answers the requests of one connection in order, other connections are served between them
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                writer.write(_encode({'error': "Request too long"}))
+                break
+            if not line:
+                break
+            if line.strip():
+                writer.write(await loop.run_in_executor(executor, server.handle_line, line))
+                await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_unix(server: RegexServer, path: str = DEFAULT_SOCKET_PATH) -> None:
+    """
+    Serves requests on a Unix domain socket until cancelled, every connection can send any number of requests.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    # stop on SIGTERM like on Ctrl+C, so the socket file is removed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    executor = _request_executor()
+    unix_server = await asyncio.start_unix_server(
+        lambda reader, writer: _serve_stream(server, executor, reader, writer), path, limit=MAX_REQUEST_BYTES)
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+async def serve_stdio(server: RegexServer) -> None:
+    """
+    Serves requests read from stdin and writes the responses to stdout until stdin is closed.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_REQUEST_BYTES)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    with _request_executor() as executor:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                sys.stdout.buffer.write(await loop.run_in_executor(executor, server.handle_line, line))
+                sys.stdout.buffer.flush()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Keeps compiled automata in memory and answers compile, match and "
+                                                 "search requests, one JSON object per line")
+    parser.add_argument('--socket', nargs='?', const=DEFAULT_SOCKET_PATH,
+                        help=f"serve on a Unix domain socket (default path {DEFAULT_SOCKET_PATH}) "
+                             f"instead of stdin and stdout")
+    parser.add_argument('--cache-dir', help="directory with compiled automata shared between runs")
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help="maximum number of regexes kept compiled")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached states of every lazy DFA")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = RegexServer(args.max_entries, args.cache_dir, args.cache_size)
+    try:
+        if args.socket is None:
+            asyncio.run(serve_stdio(server))
+        else:
+            asyncio.run(serve_unix(server, args.socket))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import codecs
+import mmap
+import sys
+from typing import BinaryIO, Iterable, Iterator
+
+import build
+import run
+from automaton import NFA
+from dfa import LazyDFA, DEFAULT_CACHE_SIZE
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # bytes read from the input at once
+
+
+def simulate_chunks(nfa: NFA, chunks: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE) -> Iterator[str]:
+    """
+    Simulates the concatenation of the chunks as a single input string, the state is carried between chunks.
+    :param nfa: epsilon-free NFA
+    :param chunks: consecutive parts of the input string
+    :param cache_size: maximum number of cached DFA states
+    :return: generator of 'Y'/'N' results for every chunk, same as run.simulate on the whole input
+    """
+    lazy_dfa = LazyDFA(nfa, cache_size)
+    state = lazy_dfa.start
+    for chunk in chunks:
+        result, state = lazy_dfa.run(chunk, state)
+        yield result
+
+
+def match_offsets(nfa: NFA, chunks: Iterable[str], cache_size: int = DEFAULT_CACHE_SIZE) -> Iterator[int]:
+    """
+    Same as simulate_chunks, but yields only the offsets i for which the prefix input[:i + 1] is accepted.
+    """
+    offset = 0
+    for result in simulate_chunks(nfa, chunks, cache_size):
+        position = result.find('Y')
+        while position != -1:
+            yield offset + position
+            position = result.find('Y', position + 1)
+        offset += len(result)
+
+
+def read_chunks(stream: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = 'utf-8') -> Iterator[str]:
+    """
+    Reads a binary stream in chunks and decodes them, characters split between chunks are handled.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def mmap_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = 'utf-8') -> Iterator[str]:
+    """
+    Memory-maps the file and decodes it chunk by chunk, only the current chunk is copied into memory.
+    """
+    with open(path, 'rb') as input_file:
+        # empty files can not be memory-mapped
+        if input_file.seek(0, 2) == 0:
+            return
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            for start in range(0, len(mapped), chunk_size):
+                yield decoder.decode(mapped[start:start + chunk_size])
+            tail = decoder.decode(b'', final=True)
+            if tail:
+                yield tail
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulates the whole content of a file as a single input string "
+                                                 "without loading it into memory")
+    parser.add_argument('input', help="input file, '-' for stdin")
+    automaton = parser.add_mutually_exclusive_group(required=True)
+    automaton.add_argument('--regex', help="regular expression to compile")
+    automaton.add_argument('--nfa', help="file with an NFA printed by build.py")
+    parser.add_argument('--offsets', action='store_true',
+                        help="print offsets of accepted prefixes, one per line, instead of 'Y'/'N' for every prefix")
+    parser.add_argument('--no-mmap', action='store_true', help="read the input file instead of memory-mapping it")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="bytes processed at once")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help="maximum number of cached DFA states")
+    return parser.parse_args()
+
+
+def _write_results(nfa: NFA, chunks: Iterable[str], args: argparse.Namespace) -> None:
+    # stdout.buffer is a buffered binary writer, results are written without building them up in memory
+    output = sys.stdout.buffer
+    if args.offsets:
+        for offset in match_offsets(nfa, chunks, args.cache_size):
+            output.write(b'%d\n' % offset)
+    else:
+        for result in simulate_chunks(nfa, chunks, args.cache_size):
+            output.write(result.encode('ascii'))
+        output.write(b'\n')
+    output.flush()
+
+
+def main():
+    args = parse_args()
+
+    if args.regex is not None:
+        nfa: NFA = build.compile_regex(args.regex)
+    else:
+        with open(args.nfa, 'r') as nfa_file:
+            nfa: NFA = run.read_nfa(nfa_file)
+
+    if args.input == '-':
+        _write_results(nfa, read_chunks(sys.stdin.buffer, args.chunk_size), args)
+    elif args.no_mmap:
+        with open(args.input, 'rb') as input_file:
+            _write_results(nfa, read_chunks(input_file, args.chunk_size), args)
+    else:
+        _write_results(nfa, mmap_chunks(args.input, args.chunk_size), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+from typing import Dict, List, Optional, Sequence
+
+from alphabet import AlphabetPartition
+from automaton import NFA
+from batch import match_many
+from charclass import Symbol, label_matches
+from dfa import DFAStateLimitError, DEFAULT_CACHE_SIZE, determinize
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, inputs are then matched one by one by the lazy DFA
+    numpy = None
+
+MAX_VECTORIZED_STATES = 4096  # larger DFAs are not built, their inputs are matched by the lazy DFA
+
+
+class DenseDFA:
+    def __init__(self, nfa: NFA, max_states: int = MAX_VECTORIZED_STATES) -> None:
+        """
+        DFA of an epsilon-free NFA as a dense NumPy transition table, which simulates many inputs at once:
+        the inputs are rows of a 2-D array of character class ids, and every column is one fancy-indexing step
+        that advances the states of all rows.
+
+        :param nfa: epsilon-free NFA
+        :param max_states: maximum number of DFA states, DFAStateLimitError is raised if there are more
+        """
+        if numpy is None:
+            raise RuntimeError("DenseDFA requires NumPy")
+
+        self.alphabet = AlphabetPartition.from_nfa(nfa)
+        dfa = determinize(nfa, max_states)
+
+        # state len(dfa.states) is the dead state, reached on transitions missing from the partial DFA
+        dead_state = len(dfa.states)
+        rows = [[dead_state] * len(self.alphabet) for _ in range(dead_state + 1)]
+
+        # characters of a class behave the same in the NFA, so the representative of the class
+        # tells which DFA transition the whole class takes
+        label_classes: Dict[Symbol, List[int]] = {}
+        for state, state_transitions in dfa.transitions.items():
+            for label, destinations in state_transitions.items():
+                if label not in label_classes:
+                    label_classes[label] = [class_id for class_id in range(1, len(self.alphabet))
+                                            if label_matches(label, self.alphabet.representative(class_id))]
+                destination, = destinations
+                for class_id in label_classes[label]:
+                    rows[state][class_id] = destination
+
+        self.start = dfa.start_state
+        self.table = numpy.array(rows, dtype=numpy.intp)
+        self.accepting = numpy.zeros(dead_state + 1, dtype=bool)
+        self.accepting[list(dfa.accept_states)] = True
+
+    def encode(self, inputs: Sequence[str]):
+        """
+        Returns the class ids of the inputs as a 2-D array with one row per input, padded with class 0
+        to the length of the longest input. Columns are contiguous, since the simulation reads them one at a time.
+        """
+        # one translation of all inputs together, calling str.translate per input would dominate the time
+        dtype = numpy.uint8 if len(self.alphabet) <= 256 else numpy.uint32
+        symbol_classes = numpy.frombuffer(self.alphabet.translate(''.join(inputs)), dtype=dtype)
+        lengths = numpy.fromiter(map(len, inputs), dtype=numpy.intp, count=len(inputs))
+        width = int(lengths.max()) if len(inputs) else 0
+        if len(symbol_classes) == len(inputs) * width:
+            # fixed-width records only need to be reshaped
+            rows = symbol_classes.reshape(len(inputs), width)
+        else:
+            rows = numpy.zeros((len(inputs), width), dtype=dtype)
+            rows[numpy.arange(width) < lengths[:, None]] = symbol_classes
+        return numpy.asfortranarray(rows)
+
+    def accept_matrix(self, inputs: Sequence[str]):
+        """
+        Returns a boolean array with one row per input, column i is True if input[:i + 1] is accepted.
+        Columns past the end of a shorter input are meaningless.
+        """
+        symbol_classes = self.encode(inputs)
+        states = numpy.full(len(inputs), self.start, dtype=numpy.intp)
+        accepted = numpy.empty(symbol_classes.shape, dtype=bool, order='F')
+        for column in range(symbol_classes.shape[1]):
+            states = self.table[states, symbol_classes[:, column]]
+            accepted[:, column] = self.accepting[states]
+        return accepted
+
+    def match(self, inputs: Sequence[str]) -> List[str]:
+        """
+        Returns the 'Y'/'N' result for each input, the same as run.simulate.
+        """
+        letters = numpy.where(self.accept_matrix(inputs), ord('Y'), ord('N')).astype(numpy.uint8)
+        results = letters.tobytes('C').decode('ascii') if len(inputs) else ''
+        width = letters.shape[1]
+        return [results[i * width:i * width + len(input_string)] for i, input_string in enumerate(inputs)]
+
+
+def compile_dense(nfa: NFA, max_states: int = MAX_VECTORIZED_STATES) -> Optional[DenseDFA]:
+    """
+    Returns the dense DFA of the NFA, None if NumPy is missing or the DFA has more than max_states states.
+    """
+    if numpy is None:
+        return None
+    try:
+        return DenseDFA(nfa, max_states)
+    except DFAStateLimitError:
+        return None
+
+
+def match_matrix(nfa: NFA, inputs: Sequence[str], dense_dfa: Optional[DenseDFA] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE) -> List[str]:
+    """
+    Returns the 'Y'/'N' result for each input, vectorized with NumPy if possible,
+    otherwise with the lazy DFA of batch.match_many.
+    :param nfa: epsilon-free NFA
+    :param inputs: input strings, best of similar length
+    :param dense_dfa: dense DFA of the NFA from compile_dense, to reuse it between calls
+    """
+    if dense_dfa is None:
+        dense_dfa = compile_dense(nfa)
+    if dense_dfa is None:
+        return list(match_many(nfa, inputs, cache_size))
+    return dense_dfa.match(inputs)